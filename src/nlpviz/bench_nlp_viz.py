@@ -0,0 +1,386 @@
+'''
+Timing and memory measurements for the stages of the 
+nlp_viz pipeline. Runs offline with synthetic phrases. 
+From this directory:
+
+    python bench_nlp_viz.py
+    python bench_nlp_viz.py --phrases 100 1000 --length 20 --stages qcut ingest
+    
+To catch regressions, save the results of one run, 
+and compare a later run against them:
+
+    python bench_nlp_viz.py --save baseline.json
+    python bench_nlp_viz.py --compare baseline.json
+    
+The comparison exits with status 1 if any stage got 
+slower than --tolerance times its baseline time. Stages
+that go through domonic or handle one word at a time in 
+Python are skipped for tables with more than --max-slow-tokens
+words.
+'''
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from nlp_viz import HTMLTable, WordStyles, RenderBackends, Binner, QuantileBinner
+
+# Results of all report() calls of this run:
+RESULTS = []
+
+# ------------------ Utilities ----------------
+
+#------------------------------------
+# make_phrases
+#-------------------
+
+def make_phrases(num_phrases, phrase_len, vocab_size=5000, seed=42):
+    '''
+    Return a list of num_phrases phrases, each a list of
+    phrase_len (word, score) tuples. Words are drawn from
+    a Zipf distribution over vocab_size words, so they
+    repeat the way they do in NLP corpora.
+
+    :param num_phrases: number of phrases to create
+    :type num_phrases: int
+    :param phrase_len: number of words per phrase
+    :type phrase_len: int
+    :param vocab_size: number of distinct words
+    :type vocab_size: int
+    :param seed: random seed
+    :type seed: int
+    :return list of phrases
+    :rtype [[(str, float)]]
+    '''
+    rng = np.random.default_rng(seed)
+    word_ids = np.minimum(rng.zipf(1.3, size=(num_phrases, phrase_len)), vocab_size)
+    scores   = rng.normal(0, 100, size=(num_phrases, phrase_len)).round(3)
+    return [[(f'w{word_id}', score)
+             for word_id, score in zip(phrase_word_ids.tolist(), phrase_scores.tolist())]
+            for phrase_word_ids, phrase_scores in zip(word_ids, scores)]
+
+#------------------------------------
+# measure
+#-------------------
+
+def measure(func, *args, **kwargs):
+    '''
+    Call func with the given arguments twice: once to
+    take the wall time, and once under tracemalloc to
+    take the peak of memory allocated during the call, 
+    as tracing slows down allocation-heavy code unevenly.
+    So func must do the same work when called again.
+
+    :param func: function to measure
+    :type func: callable
+    :return elapsed seconds, and peak bytes
+    :rtype (float, int)
+    '''
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    
+    tracemalloc.start()
+    func(*args, **kwargs)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+#------------------------------------
+# report
+#-------------------
+
+def report(stage, params, elapsed, peak):
+    '''
+    Print one result line, and add it to RESULTS.
+    '''
+    print(f"{stage:<28} {params:<38} {elapsed * 1000:>12.2f} ms {peak / 2**20:>10.2f} MiB")
+    RESULTS.append({'stage'   : stage, 
+                    'params'  : params, 
+                    'seconds' : elapsed, 
+                    'peak'    : peak})
+
+#------------------------------------
+# compare
+#-------------------
+
+def compare(baseline_path, tolerance):
+    '''
+    Print how the time of each stage in RESULTS compares
+    to the same stage in a file saved with --save. Return
+    the number of stages slower than tolerance times their
+    baseline.
+    '''
+    with open(baseline_path) as fd:
+        baseline = {(result['stage'], result['params']) : result 
+                    for result in json.load(fd)}
+    num_regressions = 0
+    for result in RESULTS:
+        base = baseline.get((result['stage'], result['params']))
+        if base is None:
+            continue
+        ratio = result['seconds'] / max(base['seconds'], 1e-9)
+        regressed = ratio > tolerance
+        num_regressions += regressed
+        print(f"{result['stage']:<28} {result['params']:<38} {ratio:>8.2f}x time "
+              f"{result['peak'] / max(base['peak'], 1):>8.2f}x memory"
+              f"{'   REGRESSION' if regressed else ''}")
+    return num_regressions
+
+# ------------------ Benchmarks ----------------
+
+#------------------------------------
+# bench_ingest
+#-------------------
+
+def bench_ingest(num_phrases, phrase_len, phrases):
+    '''
+    Time adding phrases to a table as (word, score)
+    tuples, and as arrays, including binning.
+    '''
+    params = f"phrases={num_phrases} len={phrase_len}"
+    
+    def ingest_tuples():
+        tbl = HTMLTable(None)
+        tbl.add_rows(phrases)
+        tbl.update_bins()
+    
+    tokens = [word for phrase in phrases for word, _score in phrase]
+    scores = np.array([score for phrase in phrases for _word, score in phrase])
+    lengths = np.full(num_phrases, phrase_len)
+    
+    def ingest_arrays():
+        HTMLTable.from_arrays(tokens, scores, lengths).update_bins()
+    
+    elapsed, peak = measure(ingest_tuples)
+    report('add_rows', params, elapsed, peak)
+    elapsed, peak = measure(ingest_arrays)
+    report('from_arrays', params, elapsed, peak)
+
+#------------------------------------
+# bench_adjust_table_width
+#-------------------
+
+def bench_adjust_table_width(num_phrases, phrase_len, tbl):
+    '''
+    Time padding a narrow phrase to the table width,
+    and widening the table for a wider phrase.
+    '''
+    params = f"phrases={num_phrases} len={phrase_len}"
+    narrow = np.array([('narrow', 1.)]).reshape(1, -1, 2)
+    # Each call to measure's function widens the table:
+    wide_phrases = iter([np.array([('wide', 1.)] * (phrase_len + extra)).reshape(1, -1, 2)
+                         for extra in (1, 2)])
+    elapsed, peak = measure(tbl.adjust_table_width, narrow)
+    report('adjust_table_width (pad)', params, elapsed, peak)
+    elapsed, peak = measure(lambda: tbl.adjust_table_width(next(wide_phrases)))
+    report('adjust_table_width (widen)', params, elapsed, peak)
+
+#------------------------------------
+# bench_binning
+#-------------------
+
+def bench_binning(num_phrases, phrase_len, tbl, max_slow_tokens):
+    '''
+    Time quantile binning all of a table's scores, and
+    range binning them, with the scalar Binner.select_bin()
+    on small tables, and the array Binner.select_bins().
+    '''
+    params = f"phrases={num_phrases} len={phrase_len}"
+    scores = np.array(tbl.store.scores)
+    elapsed, peak = measure(QuantileBinner.qcut, scores, HTMLTable.NUM_BINS)
+    report('QuantileBinner.qcut', params, elapsed, peak)
+    
+    binner = Binner((scores.min(), scores.max()), (0, 1), HTMLTable.NUM_BINS)
+    if len(scores) <= max_slow_tokens:
+        def select_each():
+            for score in scores.tolist():
+                binner.select_bin(score)
+        elapsed, peak = measure(select_each)
+        report('Binner.select_bin', params, elapsed, peak)
+    elapsed, peak = measure(binner.select_bins, scores)
+    report('Binner.select_bins', params, elapsed, peak)
+
+#------------------------------------
+# bench_word_spans
+#-------------------
+
+def bench_word_spans(num_phrases, phrase_len, tbl):
+    '''
+    Time creating the domonic spans of all words, for
+    each word styling.
+    '''
+    params = f"phrases={num_phrases} len={phrase_len}"
+    tbl.update_bins()
+    for stage, create_words in (('create_colored_words', tbl.create_colored_words),
+                                ('create_font_sized_words', tbl.create_font_sized_words)):
+        def create_all():
+            for phrase_num in range(num_phrases):
+                create_words(phrase_num)
+        elapsed, peak = measure(create_all)
+        report(stage, params, elapsed, peak)
+
+#------------------------------------
+# bench_serialization
+#-------------------
+
+def bench_serialization(num_phrases, phrase_len, tbl, max_slow_tokens):
+    '''
+    Compare rendering a table through the domonic
+    document, i.e. str(tbl.doc), with the streaming 
+    writer, with inline styles, and with CSS classes, and
+    with the payload document whose rows the browser builds.
+    The domonic timing includes building the document's 
+    rows, and is skipped for large tables.
+    '''
+    params = f"phrases={num_phrases} len={phrase_len}"
+
+    def render_domonic():
+        tbl.doc = tbl.create_doc()
+        tbl.render_rows(0)
+        str(tbl.doc)
+
+    if tbl.store.num_tokens <= max_slow_tokens:
+        elapsed, peak = measure(render_domonic)
+        report('render (domonic)', params, elapsed, peak)
+    elapsed, peak = measure(tbl.write_to, io.StringIO(), RenderBackends.STREAM)
+    report('render (stream)', params, elapsed, peak)
+    tbl.css_classes = True
+    elapsed, peak = measure(tbl.write_to, io.StringIO(), RenderBackends.STREAM)
+    report('render (stream, classes)', params, elapsed, peak)
+    tbl.css_classes = False
+    elapsed, peak = measure(tbl.write_to, io.StringIO(), RenderBackends.PAYLOAD)
+    report('render (payload)', params, elapsed, peak)
+
+#------------------------------------
+# bench_sparse_render
+#-------------------
+
+def bench_sparse_render(num_phrases, phrase_len, tbl):
+    '''
+    Time streaming a table with only the top k words of
+    each phrase styled, for k of about a tenth, a quarter,
+    and three quarters of the phrase length, next to
+    styling all words. Styling fewer words should never
+    take longer than styling all of them.
+    '''
+    elapsed, peak = measure(tbl.write_to, io.StringIO(), RenderBackends.STREAM)
+    report('render (stream, dense)', f"phrases={num_phrases} len={phrase_len}", elapsed, peak)
+    for top_k in sorted({max(1, phrase_len // 10), max(1, phrase_len // 4), max(1, phrase_len * 3 // 4)}):
+        tbl.sparse_top_k = top_k
+        elapsed, peak = measure(tbl.write_to, io.StringIO(), RenderBackends.STREAM)
+        report('render (stream, top k)', f"phrases={num_phrases} len={phrase_len} k={top_k}", 
+               elapsed, peak)
+    tbl.sparse_top_k = None
+
+#------------------------------------
+# bench_parallel_render
+#-------------------
+
+def bench_parallel_render(num_phrases, phrase_len, tbl, workers_list):
+    '''
+    Time HTMLTable.render() with each number of worker
+    processes, and print the speedup over one process,
+    which is bounded by the number of cores. Peak memory
+    is that of this process only.
+    '''
+    single = None
+    for workers in workers_list:
+        params = f"phrases={num_phrases} len={phrase_len} workers={workers}"
+        elapsed, peak = measure(tbl.render, workers)
+        report('render (parallel)', params, elapsed, peak)
+        if workers == 1:
+            single = elapsed
+        elif single is not None:
+            print(f"{'  speedup':<28} {params:<38} {single / elapsed:>12.2f} x  "
+                  f"({os.cpu_count()} cores)")
+
+# Benchmark name --> function, in the order they run:
+STAGES = {'ingest'      : bench_ingest,
+          'width'       : bench_adjust_table_width,
+          'binning'     : bench_binning,
+          'spans'       : bench_word_spans,
+          'serialize'   : bench_serialization,
+          'sparse'      : bench_sparse_render,
+          'parallel'    : bench_parallel_render
+          }
+
+# ------------------ Main ----------------
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Time nlp_viz pipeline stages")
+    parser.add_argument('--phrases',
+                        type=int,
+                        nargs='+',
+                        default=[10, 100, 1000, 10000, 100000],
+                        help='numbers of phrases per table')
+    parser.add_argument('--length',
+                        type=int,
+                        nargs='+',
+                        default=[5, 20, 128, 512],
+                        help='numbers of words per phrase')
+    parser.add_argument('--stages',
+                        nargs='+',
+                        choices=list(STAGES),
+                        default=list(STAGES),
+                        help='which benchmarks to run')
+    parser.add_argument('--workers',
+                        type=int,
+                        nargs='+',
+                        default=[1, 2, 4, 8],
+                        help='numbers of processes for parallel rendering')
+    parser.add_argument('--max-tokens',
+                        type=int,
+                        default=10_000_000,
+                        help='skip tables with more words than this')
+    parser.add_argument('--max-slow-tokens',
+                        type=int,
+                        default=100_000,
+                        help='skip per-word Python and domonic stages for tables with more words')
+    parser.add_argument('--save',
+                        help='file to which to write the results as JSON')
+    parser.add_argument('--compare',
+                        help='JSON file of earlier results to compare against')
+    parser.add_argument('--tolerance',
+                        type=float,
+                        default=1.5,
+                        help='time ratio to baseline above which a stage counts as regressed')
+    args = parser.parse_args()
+
+    for phrase_len in args.length:
+        for num_phrases in args.phrases:
+            if num_phrases * phrase_len > args.max_tokens:
+                continue
+            phrases = make_phrases(num_phrases, phrase_len)
+            tbl = HTMLTable(phrases, word_styling=WordStyles.FONT_SIZE)
+            if 'ingest' in args.stages:
+                bench_ingest(num_phrases, phrase_len, phrases)
+            if 'width' in args.stages:
+                # Adjusting the width changes the table:
+                bench_adjust_table_width(num_phrases, phrase_len, 
+                                         HTMLTable(phrases, word_styling=WordStyles.FONT_SIZE))
+            if 'binning' in args.stages:
+                bench_binning(num_phrases, phrase_len, tbl, args.max_slow_tokens)
+            if 'spans' in args.stages and num_phrases * phrase_len <= args.max_slow_tokens:
+                bench_word_spans(num_phrases, phrase_len, tbl)
+            if 'serialize' in args.stages:
+                bench_serialization(num_phrases, phrase_len, tbl, args.max_slow_tokens)
+            if 'sparse' in args.stages:
+                bench_sparse_render(num_phrases, phrase_len, tbl)
+            if 'parallel' in args.stages:
+                bench_parallel_render(num_phrases, phrase_len, tbl, args.workers)
+
+    if args.save:
+        with open(args.save, 'w') as fd:
+            json.dump(RESULTS, fd, indent=1)
+    if args.compare:
+        print()
+        if compare(args.compare, args.tolerance) > 0:
+            sys.exit(1)
@@ -4,20 +4,150 @@ Created on Apr 5, 2022
 @author: paepcke
 '''
 
+import base64
+import collections
+import contextlib
+import copy
+import functools
+import hashlib
+import html
+import importlib
+import io
+import json
+import os
 import tempfile
+import threading
 import time
+import tracemalloc
 from enum import Enum
 import webbrowser
 
 import numpy as np
-import matplotlib
 
-import domonic as dm
+# --------------- _LazyModule ---------------
+class _LazyModule:
+    '''
+    Stands in for a module that is imported upon first
+    access of one of its attributes. Keeps matplotlib and
+    domonic out of jobs that only bin scores, or stream HTML.
+    '''
+    def __init__(self, module_name):
+        self._module_name = module_name
+        self._module = None
+        
+    def __getattr__(self, attr_name):
+        if self._module is None:
+            self._module = importlib.import_module(self._module_name)
+        return getattr(self._module, attr_name)
+
+matplotlib = _LazyModule('matplotlib')
+dm = _LazyModule('domonic')
 
 class WordStyles(Enum):
     FONT_SIZE  = 0
     FONT_COLOR = 1
 
+class BinScopes(Enum):
+    # Quantiles over all scores in the table:
+    GLOBAL = 0
+    # Quantiles over each phrase's own scores:
+    PHRASE = 1
+    # Quantiles over the scores of each group of
+    # phrases, as passed to HTMLTable.add_rows():
+    GROUP  = 2
+
+class OutOfRange(Enum):
+    # Treat values outside the input range as if
+    # they were at the nearest end of the range:
+    CLIP      = 0
+    # Return a numpy masked array, with the
+    # out-of-range positions masked:
+    MASK      = 1
+    # Bin id -1, or mapped value NaN:
+    MINUS_ONE = 2
+
+class SubwordSchemes(Enum):
+    # BERT: continuation pieces start with '##':
+    WORDPIECE     = 0
+    # GPT-2, RoBERTa: word-initial pieces start with 'Ġ':
+    BPE           = 1
+    # T5, XLNet: word-initial pieces start with '▁':
+    SENTENCEPIECE = 2
+
+class SubwordReductions(Enum):
+    # How the scores of a word's pieces are combined:
+    SUM  = 0
+    MEAN = 1
+    MAX  = 2
+
+class RenderBackends(Enum):
+    # Write HTML strings directly from the phrase store:
+    STREAM  = 0
+    # Serialize the domonic document in HTMLTable.doc:
+    DOMONIC = 1
+    # Embed the store's arrays, and a script that
+    # builds the rows in the browser:
+    PAYLOAD = 2
+
+# Characters escaped in HTML attribute values,
+# the same as domonic escapes them:
+ATTR_ESCAPES = str.maketrans({'&' : '&amp;',
+                              '<' : '&lt;',
+                              '>' : '&gt;',
+                              '"' : '&quot;'
+                              })
+
+# --------------- BinStyles ---------------
+class BinStyles:
+    '''
+    Precomputed CSS for the words in each bin under
+    one word styling. All attributes are arrays indexed
+    by bin id, so styles for a whole phrase are gathered 
+    with one fancy-indexing operation:
+    
+        o word_styles:       style of a word's <span>
+        o darken_background: whether the word's cell 
+                             background is to be darkened
+        o cell_styles:       style of the word's <td>
+        o cell_openers:      '<td style=...><span style=...>' 
+                             with attribute values escaped
+        o class_names:       CSS class of the word's <td>, 
+                             such as 'fc3', or 'fc0d' when
+                             the background is darkened
+        o class_openers:     '<td class=...><span>'
+        
+    The style_rules attribute holds the style sheet rules
+    that define the classes.
+    '''
+    
+    def __init__(self, word_styles, darken_background, dark_background, class_prefix):
+        
+        self.word_styles = np.array(word_styles, dtype=object)
+        self.darken_background = np.array(darken_background, dtype=bool)
+        self.cell_styles = np.array([f'background-color : {dark_background}' if darken else ''
+                                     for darken in darken_background],
+                                    dtype=object)
+        self.cell_openers = np.array([f'<td style="{cell_style.translate(ATTR_ESCAPES)}">'
+                                      f'<span style="{word_style.translate(ATTR_ESCAPES)}">'
+                                      for word_style, cell_style 
+                                      in zip(word_styles, self.cell_styles)],
+                                     dtype=object)
+        
+        self.class_names = np.array([f"{class_prefix}{bin_id}{'d' if darken else ''}"
+                                     for bin_id, darken in enumerate(darken_background)],
+                                    dtype=object)
+        self.class_openers = np.array([f'<td class="{class_name}"><span>'
+                                       for class_name in self.class_names],
+                                      dtype=object)
+        rules = []
+        for class_name, word_style, cell_style in zip(self.class_names, 
+                                                      word_styles, 
+                                                      self.cell_styles):
+            if cell_style:
+                rules.append(f'td.{class_name} {{{cell_style}}}')
+            rules.append(f'td.{class_name} span {{{word_style}}}')
+        self.style_rules = '\n'.join(rules)
+
 # --------------- HTMLTable ---------------
 class HTMLTable:
     '''
@@ -54,6 +184,17 @@ class HTMLTable:
        4 : 1.
        }
 
+    # Colors that matplotlib computes for the default 
+    # colormap and lookup, as (cmap_name, cmap fractions)
+    # --> RGBA per fraction. Spares importing matplotlib:
+    FONT_COLOR_RGBA = {
+        ('YlGn', (0.4, 0.5, 0.6, 0.7, 1.)) : ((162, 216, 137, 255),
+                                             (119, 197, 120, 255),
+                                             (75, 176, 98, 255),
+                                             (46, 146, 76, 255),
+                                             (0, 69, 41, 255))
+        }
+
     # Color bin below which the text is light
     # enough that the background of the text
     # (i.e. the table cell color) should be darkened 
@@ -69,31 +210,479 @@ class HTMLTable:
                         3: 600,
                         4: 1300
                         }
+    
+    # Document-wide CSS:
+    STYLE_SHEET = '''
+              table, th, td {border: 1px solid;
+                             border-collapse: collapse;
+                            }
+              td {text-align:center;
+                  padding:10px;
+                 }
+              tr:nth-child(odd) {background-color: DarkGray;}
+        '''
+    
+    # Word and score shown in the cells that fill
+    # phrases shorter than the table's widest phrase
+    # when rendered:
+    PAD_WORD  = ''
+    PAD_SCORE = 0.
+
+    # Methods whose calls instrument() records:
+    INSTRUMENTED_METHODS = ('canonicalize_word_attr',
+                            'adjust_table_width',
+                            'update_bins',
+                            'prep_table',
+                            'create_doc',
+                            'render_rows',
+                            'phrase_styles',
+                            'row_pair_html',
+                            'render_row_pair',
+                            'write_to',
+                            'render'
+                            )
+
+    # Number of scores binned at a time. Bounds the
+    # temporary memory of binning large stores:
+    BIN_CHUNK_TOKENS = 2**20
+
+    # With css_classes=True: start of the CSS class
+    # names for each word styling:
+    CSS_CLASS_PREFIXES = {WordStyles.FONT_SIZE  : 'fs',
+                          WordStyles.FONT_COLOR : 'fc'
+                          }
+
+    # File name of each page written by write_pages(),
+    # formatted with the 1-based page number:
+    PAGE_NAME = 'page{:05d}.html'
+
+    # Part of every render cache key. Increment whenever
+    # row_pair_html() changes the HTML it produces, so that
+    # fragments cached on disk by earlier versions are not
+    # reused:
+    ROW_PAIR_FORMAT = 1
+
+    # PAYLOAD backend: number of array elements base64-
+    # encoded at a time; a multiple of 3, so that the
+    # encoded chunks concatenate without padding:
+    PAYLOAD_CHUNK_ITEMS = 3 * 2**16
+    # Number of row-pairs the embedded script adds
+    # to the page at a time while scrolling:
+    PAYLOAD_ROWS_PER_CHUNK = 200
+    # Script that decodes the payload, and appends
+    # row-pairs whenever the end of the table nears
+    # the viewport. Rows are the same HTML that the
+    # STREAM backend writes with css_classes=True:
+    PAYLOAD_SCRIPT = '''
+(function () {
+  var data = JSON.parse(document.getElementById('nlpviz-data').textContent);
+  function decodeBytes(b64) {
+    if (Uint8Array.fromBase64) return Uint8Array.fromBase64(b64);
+    var binary = atob(b64), bytes = new Uint8Array(binary.length);
+    for (var i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
+    return bytes;
+  }
+  function decode(b64, ArrayType) {
+    return new ArrayType(decodeBytes(b64).buffer);
+  }
+  // All words in one UTF-8 pass, separated by NUL:
+  data.vocab = new TextDecoder().decode(decodeBytes(data.vocab)).split('\\0');
+  var offsets   = decode(data.offsets, Float64Array);
+  var tokenIds  = decode(data.token_ids, Int32Array);
+  var binIds    = decode(data.bin_ids, Int16Array);
+  var scores    = decode(data.scores, Float64Array);
+  var padBinIds = decode(data.pad_bin_ids, Int16Array);
+  var styleIds  = decode(data.style_ids, Int8Array);
+  // Sparse mode: whether each word is styled:
+  var styled    = data.styled === undefined ? null : decode(data.styled, Uint8Array);
+  var rows      = document.getElementById('nlpviz-rows');
+  var sentinel  = document.getElementById('nlpviz-more');
+  var nextRow   = 0;
+  // Like Python's str() of a float: the shortest digits,
+  // in exponent notation outside of 1e-4 <= |score| < 1e16:
+  function formatScore(score) {
+    if (isNaN(score)) return 'nan';
+    if (!isFinite(score)) return score > 0 ? 'inf' : '-inf';
+    if (score === 0) return Object.is(score, -0) ? '-0.0' : '0.0';
+    var parts    = score.toExponential().split('e');
+    var exponent = parseInt(parts[1], 10);
+    if (exponent < -4 || exponent >= 16) {
+      var digits = String(Math.abs(exponent));
+      return parts[0] + (exponent < 0 ? 'e-' : 'e+') + (digits.length < 2 ? '0' : '') + digits;
+    }
+    return Number.isInteger(score) ? score.toFixed(1) : String(score);
+  }
+  function cell(classNames, binId, word) {
+    return '<td class="' + classNames[binId] + '"><span>' + word + '</span></td>';
+  }
+  function rowPair(row) {
+    var classNames = data.class_names[styleIds[row]];
+    var wordCells = '', scoreCells = '';
+    // Words of the current run of plain cells, and its length:
+    var plainWords = [], numPlain = 0;
+    function endPlainRun() {
+      if (numPlain === 0) return;
+      var colspan = numPlain > 1 ? ' colspan="' + numPlain + '"' : '';
+      wordCells  += '<td' + colspan + '>' + plainWords.join(' ') + '</td>';
+      scoreCells += '<td' + colspan + '></td>';
+      plainWords = [];
+      numPlain = 0;
+    }
+    for (var col = 0; col < data.width; col++) {
+      var i = offsets[row] + col, isPad = i >= offsets[row + 1];
+      var word = isPad ? data.pad_word : data.vocab[tokenIds[i]];
+      if (styled !== null && (isPad || !styled[i])) {
+        if (!isPad) plainWords.push(word);
+        numPlain++;
+        continue;
+      }
+      endPlainRun();
+      wordCells  += cell(classNames, isPad ? padBinIds[row] : binIds[i], word);
+      scoreCells += '<td>' + formatScore(isPad ? data.pad_score : scores[i]) + '</td>';
+    }
+    endPlainRun();
+    return '<tr>' + wordCells + '</tr><tr>' + scoreCells + '</tr>';
+  }
+  function renderMore() {
+    while (nextRow < data.num_phrases &&
+           sentinel.getBoundingClientRect().top < window.innerHeight + 2000) {
+      var endRow = Math.min(nextRow + data.rows_per_chunk, data.num_phrases);
+      var html = '';
+      for (; nextRow < endRow; nextRow++) html += rowPair(nextRow);
+      rows.insertAdjacentHTML('beforeend', html);
+    }
+  }
+  new IntersectionObserver(renderMore, {rootMargin: '2000px'}).observe(sentinel);
+  renderMore();
+})();
+'''
 
     #------------------------------------
     # Constructor
     #-------------------
     
-    def __init__(self, word_attributions, word_styling=WordStyles.FONT_SIZE):
+    def __init__(self, 
+                 word_attributions, 
+                 word_styling=WordStyles.FONT_SIZE,
+                 score_dtype=np.float64,
+                 bin_scope=BinScopes.GLOBAL,
+                 group=None,
+                 quantile_binner=None,
+                 css_classes=False,
+                 store_dir=None,
+                 render_cache=None,
+                 sparse_top_k=None,
+                 sparse_min_bin=None,
+                 subword_merger=None):
         '''
         Constructs a domonic HTML document. The
         instance will be ready for client invoking
         its render_to_web() method without arguments. 
         
-        :param word_attributions: list of tuples, each containing a word and its score
-        :type word_attributions: [(str, float)]
+        :param word_attributions: list of tuples, each containing a word and its score,
+            or None for a table without phrases so far. For arrays of
+            tokens and scores, see from_arrays() and from_batch()
+        :type word_attributions: {None | [(str, float)]}
+        :param word_styling: how to reflect scores in the words
+        :type word_styling: WordStyles
+        :param score_dtype: float type in which scores are stored;
+            np.float32 halves score memory for large corpora
+        :type score_dtype: np.dtype
+        :param bin_scope: which scores are pooled for computing
+            the quantile bins of a word: all of the table's, those
+            of the word's phrase, or those of the phrase's group
+        :type bin_scope: BinScopes
+        :param group: group of the initial phrases; used with
+            the GROUP bin scope
+        :type group: Hashable
+        :param quantile_binner: with the GLOBAL bin scope, an
+            optional object with update(scores) and edges(num_bins)
+            methods, such as a StreamingQuantileBinner. It is fed
+            only the scores of new phrases, and supplies the bin 
+            edges, instead of quantiling all scores on every add_rows()
+        :type quantile_binner: {None | StreamingQuantileBinner}
+        :param css_classes: if True, word cells reference one CSS
+            class per word styling and bin, defined once in the
+            document's style sheet, instead of each carrying 
+            its inline styles. Makes large documents several
+            times smaller
+        :type css_classes: bool
+        :param store_dir: if given, phrases are kept in memory-mapped
+            files in this directory (see MmapPhraseStore), rather than
+            in memory. Phrases already in the directory are part of
+            the table; see open(). Global bins are exact, as for
+            tables in memory, and keep the distinct scores, and 
+            an index of the words by score in memory; pass a 
+            StreamingQuantileBinner to bound that memory at the 
+            price of approximate bins. Per-phrase bins are 
+            computed in bounded memory; the GROUP scope, however,
+            needs temporary arrays for all scores in the store
+        :type store_dir: {None | str}
+        :param render_cache: if given, row-pair HTML is looked up
+            in, and added to this cache, which may be shared with
+            other tables
+        :type render_cache: {None | RenderCache}
+        :param sparse_top_k: if given, only the words of each phrase
+            with the sparse_top_k largest absolute scores are styled,
+            and have score cells. Runs of other words are shown as 
+            plain text in one cell each; see styled_columns()
+        :type sparse_top_k: {None | int}
+        :param sparse_min_bin: if given, words in this bin or 
+            higher are styled as well
+        :type sparse_min_bin: {None | int}
+        :param subword_merger: if given, tokenizer pieces passed to
+            add_rows() and add_arrays() are merged into words, and
+            their scores combined, before the words are stored.
+            Binning and rendering then only see words
+        :type subword_merger: {None | SubwordMerger}
+        '''
+        if type(bin_scope) != BinScopes:
+            raise ValueError(f'Bad bin scope: {bin_scope}')
+        if quantile_binner is not None and bin_scope != BinScopes.GLOBAL:
+            raise ValueError('A quantile binner only applies to the global bin scope')
+        self.bin_scope = bin_scope
+        self.quantile_binner = quantile_binner
+        self.css_classes = css_classes
+        self.render_cache = render_cache
+        self.sparse_top_k = sparse_top_k
+        self.subword_merger = subword_merger
+        self.sparse_min_bin = sparse_min_bin
+        # Raw token --> id of its cleaned word in self.store;
+        # see intern_tokens():
+        self.raw_token_ids = {}
+        # Hashes already fed the settings part of render
+        # cache keys, by settings; see row_pair_key():
+        self.row_pair_digests = {}
+        # Exact global bins, when no quantile_binner is given:
+        self.exact_binner = IncrementalQuantileBinner()
+        # Number of tokens whose scores were passed 
+        # to the quantile_binner, or exact_binner:
+        self.num_binner_tokens = 0
+        # Whether the binner was given the padding score:
+        self.pad_score_binned = False
+        # With exact global bins, positions of the words in
+        # self.store by score; see rebin_moved():
+        self.score_index = ScoreIndex()
+
+        # Words, scores, phrase boundaries, groups, and 
+        # word stylings of all phrases:
+        if store_dir is None:
+            self.store = PhraseStore(score_dtype=score_dtype)
+        else:
+            self.store = MmapPhraseStore(store_dir, score_dtype=score_dtype)
+        
+        # Quantile bin edges in effect for the row-pairs 
+        # already in the table: one row of edges per group
+        # of pooled scores. The bin id of each word, and of
+        # each phrase's padding cells are kept positionally 
+        # in self.store.bin_ids and self.store.pad_bin_ids:
+        self.bin_edges  = None
+        # Cache of BinStyles instances:
+        self.bin_styles_cache = {}
+        # Method timings of the latest instrument() context:
+        self.stats = {}
+        # Bins and the domonic document are brought up to
+        # date only when needed; see update_bins() and the 
+        # doc property. Number of phrases, and table width
+        # for which bin ids are current:
+        self.num_binned_rows = 0
+        self.binned_width    = 0
+        # Document, and its table, or None if either
+        # is to be rebuilt upon next access:
+        self._doc = None
+        self._tbl = None
+        # Number of phrases whose row-pairs have already 
+        # been appended to self.tbl:
+        self.num_rendered_rows = 0
+
+        if word_attributions is not None:
+            self.add_rows(word_attributions, word_styling, group)
+
+    #------------------------------------
+    # doc
+    #-------------------
+    
+    @property
+    def doc(self):
+        '''
+        The domonic document, built upon first access,
+        and cached. Phrases added since the last access 
+        are binned, and their row-pairs appended, as long
+        as the rows already in the table would still be 
+        styled the same: i.e. as long as the quantile bin 
+        edges and the table width are unchanged. Otherwise 
+        the document is rebuilt with all phrases.
+        '''
+        self.update_bins()
+        if self._doc is None:
+            self._doc = self.create_doc()
+            self.num_rendered_rows = 0
+        if self.num_rendered_rows < self.store.num_phrases:
+            self.render_rows(self.num_rendered_rows)
+        return self._doc
+
+    @doc.setter
+    def doc(self, doc):
+        self._doc = doc
+
+    #------------------------------------
+    # tbl
+    #-------------------
+    
+    @property
+    def tbl(self):
+        '''
+        The domonic table element of self.doc.
+        '''
+        self.doc
+        return self._tbl
+
+    @tbl.setter
+    def tbl(self, tbl):
+        self._tbl = tbl
+
+    #------------------------------------
+    # css_classes, sparse_top_k, sparse_min_bin
+    #-------------------
+    
+    # Rendering settings. Changing one drops the document,
+    # whose rows were rendered with the prior setting:
+    
+    @property
+    def css_classes(self):
+        return self._css_classes
+
+    @css_classes.setter
+    def css_classes(self, css_classes):
+        self._css_classes = css_classes
+        self._doc = None
+
+    @property
+    def sparse_top_k(self):
+        return self._sparse_top_k
+
+    @sparse_top_k.setter
+    def sparse_top_k(self, sparse_top_k):
+        self._sparse_top_k = sparse_top_k
+        self._doc = None
+
+    @property
+    def sparse_min_bin(self):
+        return self._sparse_min_bin
+
+    @sparse_min_bin.setter
+    def sparse_min_bin(self, sparse_min_bin):
+        self._sparse_min_bin = sparse_min_bin
+        self._doc = None
+
+    #------------------------------------
+    # open
+    #-------------------
+    
+    @classmethod
+    def open(cls, store_dir, **kwargs):
+        '''
+        Reopen a table whose phrases were added with the 
+        given store_dir, without ingesting them again. Keyword
+        arguments, such as bin_scope, are passed to the 
+        constructor; they are not kept in the store.
+        
+        :param store_dir: directory of the table's store
+        :type store_dir: str
+        :return the table
+        :rtype HTMLTable
         '''
+        return cls(None, store_dir=store_dir, **kwargs)
 
-        self.all_word_attributions = np.array([])
-        self.row_word_styles = {}
+    #------------------------------------
+    # from_arrays
+    #-------------------
+    
+    @classmethod
+    def from_arrays(cls, tokens, scores, lengths, word_styling=WordStyles.FONT_SIZE, **kwargs):
+        '''
+        Create a table from the concatenated tokens and scores
+        of many phrases, and the length of each phrase. No
+        (word, score) tuples are built. Other keyword arguments
+        are passed to the constructor.
+        
+            HTMLTable.from_arrays(['My', 'Bonny', 'lies', 'over'],
+                                  np.array([-1., 3., 2., 10.]),
+                                  [1, 3])
+        
+        :param tokens: words of all phrases
+        :type tokens: {[str] | np.ndarray}
+        :param scores: score of each token; NaN and infinite scores raise a ValueError
+        :type scores: {[float] | np.ndarray}
+        :param lengths: number of tokens in each phrase
+        :type lengths: {[int] | np.ndarray}
+        :param word_styling: how to reflect scores in the words
+        :type word_styling: WordStyles
+        :return a new table
+        :rtype HTMLTable
+        '''
+        tbl = cls(None, word_styling, **kwargs)
+        tbl.add_arrays(tokens, scores, lengths, word_styling, kwargs.get('group'))
+        return tbl
 
-        self.add_rows(word_attributions, word_styling)
+    #------------------------------------
+    # from_batch
+    #-------------------
+    
+    @classmethod
+    def from_batch(cls, token_lists, score_matrix, attention_mask=None,
+                   word_styling=WordStyles.FONT_SIZE, **kwargs):
+        '''
+        Create a table from a batch of model outputs: one token
+        list per phrase, and a (batch_size, seq_len) matrix of 
+        attributions, such as from TruLens or Captum. Tokens 
+        where attention_mask is 0 are left out. Without a mask,
+        each phrase is as long as its token list, and the matrix
+        columns beyond are ignored. Tensors must be on the CPU;
+        anything np.asarray() accepts will do. Other keyword 
+        arguments are passed to the constructor.
+        
+        :param token_lists: each phrase's tokens, as long as
+            the matrix rows if a mask is given
+        :type token_lists: {[[str]] | np.ndarray}
+        :param score_matrix: each token's attribution score
+        :type score_matrix: np.ndarray
+        :param attention_mask: 1 for tokens to show, 0 for padding
+        :type attention_mask: {None | np.ndarray}
+        :param word_styling: how to reflect scores in the words
+        :type word_styling: WordStyles
+        :return a new table
+        :rtype HTMLTable
+        '''
+        score_matrix = np.asarray(score_matrix)
+        if score_matrix.ndim != 2 or len(token_lists) != len(score_matrix):
+            raise ValueError(f"Need one score matrix row per token list, "
+                             f"not {score_matrix.shape} for {len(token_lists)} token lists")
+        if attention_mask is None:
+            lengths = np.array([len(token_list) for token_list in token_lists], dtype=int)
+            if lengths.max(initial=0) > score_matrix.shape[1]:
+                raise ValueError(f"Token lists longer than the {score_matrix.shape[1]} score columns")
+            mask = np.arange(score_matrix.shape[1]) < lengths[:, np.newaxis]
+        else:
+            mask = np.asarray(attention_mask).astype(bool)
+            if mask.shape != score_matrix.shape:
+                raise ValueError(f"Attention mask shape {mask.shape} differs from "
+                                 f"score matrix shape {score_matrix.shape}")
+            lengths = mask.sum(axis=1)
         
+        if isinstance(token_lists, np.ndarray) and attention_mask is not None:
+            tokens = token_lists[mask]
+        else:
+            tokens = [token
+                      for token_list, row_mask in zip(token_lists, mask.tolist())
+                      for token, keep in zip(token_list, row_mask) if keep]
+        return cls.from_arrays(tokens, score_matrix[mask], lengths, word_styling, **kwargs)
+
     #------------------------------------
     # add_rows
     #-------------------
     
-    def add_rows(self, word_attributions, word_styling=WordStyles.FONT_SIZE):
+    def add_rows(self, word_attributions, word_styling=WordStyles.FONT_SIZE, group=None):
         '''
         Takes an array of word/score pair arrays. Each array
         contains all word/score pairs of one phrase.
@@ -102,98 +691,478 @@ class HTMLTable:
              ]
         A human-presentable representation is created for
         earch phrase. The phrase representations are added
-        to the ones already in self.all_word_attributions. Then
-        an HTML table is constructed with all phrases.
+        to the ones already in self.store. 
+        
+        Phrases are stored with their own length. Shorter
+        phrases are padded to the table width only when rendered.
+        
+        Neither bins nor HTML are computed here. Adding many 
+        batches thus only costs ingestion; bins are computed 
+        and the document is rendered once, upon output. 
          
         :param word_attributions:
         :type word_attributions:
         :param word_styling:
         :type word_styling:
+        :param group: any hashable, such as a model or layer
+            name, that marks the new phrases as belonging together.
+            With the GROUP bin scope, quantiles are computed over 
+            the scores of each group separately
+        :type group: Hashable
+        '''
+        
+        if type(word_styling) != WordStyles:
+            raise ValueError(f'Bad word style: {word_styling}')
+        
+        group_id = self.store.intern_group(group)
+
+        # Add all phrases to self.store at once, noting 
+        # how their words are to be styled. Each distinct
+        # token is cleaned for HTML only once; see intern_tokens():
+        
+        phrases = self.split_phrases(word_attributions)
+        tokens  = [token for phrase in phrases for token, _score in phrase]
+        scores  = np.array([score for phrase in phrases for _token, score in phrase], 
+                           dtype=np.float64)
+        lengths = np.array([len(phrase) for phrase in phrases])
+        if self.subword_merger is not None:
+            tokens, scores, lengths = self.subword_merger.merge(tokens, scores, lengths)
+        self.store.extend(self.intern_tokens(tokens), scores, lengths, 
+                          group_id, word_styling.value)
+        self.store.flush()
+
+    #------------------------------------
+    # add_arrays
+    #-------------------
+    
+    def add_arrays(self, tokens, scores, lengths, word_styling=WordStyles.FONT_SIZE, group=None):
         '''
+        Like add_rows(), but takes the concatenated tokens
+        and scores of the new phrases, plus each phrase's 
+        length. Each distinct token is cleaned for HTML and
+        looked up in the vocabulary only once, and the scores 
+        are copied into the store in one operation.
         
+        :param tokens: words of all new phrases
+        :type tokens: {[str] | np.ndarray}
+        :param scores: score of each token; NaN and infinite scores raise a ValueError
+        :type scores: {[float] | np.ndarray}
+        :param lengths: number of tokens in each phrase
+        :type lengths: {[int] | np.ndarray}
+        :param word_styling: how to reflect scores in the words
+        :type word_styling: WordStyles
+        :param group: group of the new phrases; see add_rows()
+        :type group: Hashable
+        '''
         if type(word_styling) != WordStyles:
             raise ValueError(f'Bad word style: {word_styling}')
         
-        if type(word_attributions) != np.ndarray:
-            word_attrs_np = np.array(word_attributions)
-            # If only one phrase was passed in, adjust
-            # the np array to have an additional axis that
-            # would hold multiple sentences, but in this
-            # case will only have one element:
-            if word_attrs_np.ndim < 3:
-                # the 2 are the word/score pairs:
-                word_attrs_np = word_attrs_np.reshape(1, -1, 2)
-
-        # For each phrase, clean its words so as not to
-        # conflict with HTML conventions. Add the phrase
-        # to self.all_word_attributions:
-        
-        for phrase in word_attrs_np:
-            phrase_word_attrs = []
-            for word_score in phrase:
-                phrase_word_attrs.append(self.canonicalize_word_attr(word_score))
-            phrase_word_attrs_np = np.array(phrase_word_attrs).reshape(1,-1,2) 
-            # If no attrs have been processed, this one is our first:
-            if self.all_word_attributions.ndim == 1:
-                self.all_word_attributions = phrase_word_attrs_np
+        scores  = np.asarray(scores)
+        lengths = np.asarray(lengths)
+        if scores.ndim != 1 or lengths.ndim != 1:
+            raise ValueError('Scores and lengths must be one-dimensional')
+        if not len(tokens) == len(scores) == lengths.sum():
+            raise ValueError(f"Phrase lengths add up to {lengths.sum()}, but there are "
+                             f"{len(tokens)} tokens, and {len(scores)} scores")
+        if len(lengths) == 0:
+            return
+        
+        group_id = self.store.intern_group(group)
+        if self.subword_merger is not None:
+            tokens, scores, lengths = self.subword_merger.merge(tokens, scores, lengths)
+        
+        if isinstance(tokens, np.ndarray):
+            tokens = tokens.astype(str).tolist()
+        token_ids = self.intern_tokens(tokens)
+        self.store.extend(token_ids, scores, lengths, group_id, word_styling.value)
+        self.store.flush()
+
+    #------------------------------------
+    # intern_tokens
+    #-------------------
+    
+    def intern_tokens(self, tokens):
+        '''
+        Return the store's token ids of the given raw tokens.
+        Tokens not seen before by this table are cleaned for 
+        HTML by canonicalize_word_attr(), and added to the 
+        store's vocabulary. Since tokens repeat heavily in
+        NLP corpora, the cleaning runs once per distinct 
+        token, and the ids of all others come from one 
+        dict lookup.
+        
+        :param tokens: raw tokens
+        :type tokens: [str]
+        :return token id of each token
+        :rtype np.ndarray
+        '''
+        raw_token_ids = self.raw_token_ids
+        new_tokens = [token for token in dict.fromkeys(tokens) if token not in raw_token_ids]
+        if new_tokens:
+            words = [self.canonicalize_word_attr((token, self.PAD_SCORE))[0]
+                     for token in new_tokens]
+            raw_token_ids.update(zip(new_tokens, self.store.intern(words).tolist()))
+        return np.fromiter(map(raw_token_ids.__getitem__, tokens), 
+                           dtype=PhraseStore.TOKEN_ID_DTYPE, 
+                           count=len(tokens))
+
+    #------------------------------------
+    # split_phrases
+    #-------------------
+    
+    def split_phrases(self, word_attributions):
+        '''
+        Given either a single phrase, i.e. a sequence of
+        (word, score) pairs, or a sequence of such phrases,
+        return a list of phrases.
+        
+        :param word_attributions: one or more phrases
+        :type word_attributions: {[(str, float)] | [[(str, float)]] | np.ndarray}
+        :return list of phrases
+        :rtype [[(str, float)]]
+        '''
+        # A single phrase's first element is a (word, score)
+        # pair, whose first element is a str:
+        if isinstance(word_attributions[0][0], str):
+            return [word_attributions]
+        return word_attributions
+
+    #------------------------------------
+    # render_rows
+    #-------------------
+    
+    def render_rows(self, first_row):
+        '''
+        Append one row-pair to self.tbl for each phrase
+        in self.store, starting with the phrase at index 
+        first_row. Bin ids must be up to date in 
+        self.store.bin_ids.
+        
+        :param first_row: index of first phrase to render
+        :type first_row: int
+        '''
+        
+        for row_num in range(first_row, self.store.num_phrases):
+            bin_styles = self.bin_styles(self.row_word_style(row_num))
+            bin_ids = self.padded_bin_ids(row_num)
+            html_words_row  = self._tbl.appendChild(dm.HTMLTableRowElement())
+            html_scores_row = self._tbl.appendChild(dm.HTMLTableRowElement())
+    
+            words, scores = self.padded_phrase(row_num)
+            if self.css_classes:
+                word_cells = [dm.HTMLTableCellElement(dm.HTMLSpanElement(word), _class=class_name)
+                              for word, class_name 
+                              in zip(words, bin_styles.class_names[bin_ids].tolist())]
             else:
-                width_adjusted_word_attrs = self.adjust_table_width(phrase_word_attrs_np)
-                self.all_word_attributions = np.vstack((self.all_word_attributions, 
-                                                        width_adjusted_word_attrs))
-            # Note how this row's words are to be styled:
-            self.row_word_styles[len(self.all_word_attributions) - 1] = word_styling
-
-        # Create a new tbl instance, and update the word--bin_id
-        # lookup dict:
-        self.doc = self.prep_table()
-        
-        # Create a row-pair for each phrase (styled words in first row),
-        # and scores in second row):
-        for row_num, phrase in enumerate(self.all_word_attributions):
-            if self.row_word_styles[row_num] == WordStyles.FONT_COLOR: 
-                styled_words = self.create_colored_words(phrase)
-            elif self.row_word_styles[row_num] == WordStyles.FONT_SIZE:
-                styled_words = self.create_font_sized_words(phrase)
-                
-                
-            html_words_row  = self.tbl.appendChild(dm.HTMLTableRowElement())
-            html_scores_row = self.tbl.appendChild(dm.HTMLTableRowElement())
-    
-            for i, styled_word in enumerate(styled_words):
-                if styled_word.darken_background:
-                    tbl_cell_style = f'background-color : {self.DARK_BACKGROUND}'
-                else:
-                    tbl_cell_style = ''
-                html_words_row.appendChild(dm.HTMLTableCellElement(styled_word,
-                                                                   style=tbl_cell_style))
-                attr_score = round(float(phrase[i,1]),2)
-                html_scores_row.appendChild(dm.HTMLTableCellElement(attr_score))
+                styled_words = [self.create_span(word, word_style, darken_background)
+                                for word, word_style, darken_background
+                                in self.phrase_styles(row_num)]
+                word_cells = [dm.HTMLTableCellElement(styled_word, style=tbl_cell_style)
+                              for styled_word, tbl_cell_style 
+                              in zip(styled_words, bin_styles.cell_styles[bin_ids].tolist())]
+            score_cells = [dm.HTMLTableCellElement(round(float(score),2)) for score in scores]
+            
+            # In the sparse mode, runs of plain words 
+            # replace their styled cells:
+            styled = self.styled_columns(row_num)
+            if styled is None:
+                runs = [(0, len(word_cells), True)]
+            else:
+                runs = self.styled_runs(styled)
+                num_words = len(self.store.phrase(row_num)[0])
+            for start, end, is_styled in runs:
+                if is_styled:
+                    for word_cell, score_cell in zip(word_cells[start:end], score_cells[start:end]):
+                        html_words_row.appendChild(word_cell)
+                        html_scores_row.appendChild(score_cell)
+                    continue
+                colspan = {'colspan' : end - start} if end - start > 1 else {}
+                plain_text = ' '.join(words[start:min(end, num_words)])
+                html_words_row.appendChild(dm.HTMLTableCellElement(plain_text, **colspan))
+                html_scores_row.appendChild(dm.HTMLTableCellElement(**colspan))
+        
+        self.num_rendered_rows = self.store.num_phrases
+
+    #------------------------------------
+    # update_bins
+    #-------------------
+    
+    def update_bins(self):
+        '''
+        Bin the phrases added since bins were last computed.
+        A wider table changes the padding, and thus the bins,
+        of all rows. If already rendered rows would now be 
+        styled differently, the document is dropped, to be
+        rebuilt upon next access of self.doc.
+        
+        Called by all methods that need bin ids. Clients
+        reading self.store.bin_ids or self.bin_edges directly
+        call it first.
+        '''
+        if self.num_binned_rows == self.store.num_phrases and \
+           self.binned_width == self.store.width:
+            return
+        if self.store.width != self.binned_width:
+            self.compute_bins()
+            restyle = True
+        else:
+            restyle = self.compute_bins(self.num_binned_rows)
+        self.num_binned_rows = self.store.num_phrases
+        self.binned_width    = self.store.width
+        self.store.flush()
+        if restyle:
+            self._doc = None
+            self._tbl = None
+
+    #------------------------------------
+    # compute_bins
+    #-------------------
+    
+    def compute_bins(self, first_new_row=0):
+        '''
+        Compute the quantile bin edges, and update the bin id 
+        of each word in self.store.bin_ids, and of each phrase's
+        padding cells in self.store.pad_bin_ids. Which scores
+        are pooled for the quantiles depends on self.bin_scope.
+        Only words whose bins may have changed since phrases 
+        starting at first_new_row were added are re-binned.
+        
+        Returns True if phrases before first_new_row would
+        now be styled differently, i.e. if their bin edges moved.
+        
+        :param first_new_row: index of first phrase whose
+            words have not been binned yet
+        :type first_new_row: int
+        :return whether already binned phrases changed bins
+        :rtype bool
+        '''
+        if self.bin_scope == BinScopes.GLOBAL:
+            return self.compute_global_bins(first_new_row)
+        return self.compute_grouped_bins(first_new_row)
+
+    #------------------------------------
+    # compute_global_bins
+    #-------------------
+    
+    def compute_global_bins(self, first_new_row=0):
+        '''
+        Compute bins from the quantiles of all scores,
+        across all phrases. If the edges did not change,
+        only the words of phrases starting at first_new_row 
+        are binned. Else rebin_moved() updates the words 
+        whose bins changed. See compute_bins().
+        
+        With exact bins, new words are also added to 
+        self.score_index, so that finding the words to 
+        re-bin does not scan the store.
+        '''
+        all_scores = self.store.scores
+        
+        # The binner summarizes the scores it has seen;
+        # feed it the new ones:
+        binner = self.quantile_binner if self.quantile_binner is not None else self.exact_binner
+        for chunk_start in range(self.num_binner_tokens, self.store.num_tokens, self.BIN_CHUNK_TOKENS):
+            chunk_scores = np.asarray(all_scores[chunk_start:chunk_start + self.BIN_CHUNK_TOKENS], dtype=float)
+            binner.update(chunk_scores)
+            if self.quantile_binner is None:
+                scored = np.flatnonzero(~np.isnan(chunk_scores))
+                self.score_index.insert(chunk_scores[scored], chunk_start + scored)
+        self.num_binner_tokens = self.store.num_tokens
+        # Padding cells are binned like one more score,
+        # added once, when the first phrase needs padding:
+        if not self.pad_score_binned and self.store.min_length < self.store.width:
+            binner.update([self.PAD_SCORE])
+            self.pad_score_binned = True
+        edges = binner.edges(self.NUM_BINS)
+        edges = edges.reshape(1, -1)
+        prior_edges = self.bin_edges
+        restyle = prior_edges is None or not np.array_equal(edges, prior_edges)
+        start = self.store.offsets[first_new_row]
+        if restyle:
+            self.bin_edges = edges
+            if prior_edges is None or np.isnan(prior_edges).any() or np.isnan(edges).any():
+                start = 0
+            else:
+                # Words already binned only move if an edge
+                # moved across their score:
+                self.rebin_moved(prior_edges[0], edges[0], start)
+            first_new_row = 0
+        bin_ids = self.store.bin_ids
+        for chunk_start in range(start, self.store.num_tokens, self.BIN_CHUNK_TOKENS):
+            chunk = slice(chunk_start, chunk_start + self.BIN_CHUNK_TOKENS)
+            bin_ids[chunk] = QuantileBinner._bins_to_cuts(all_scores[chunk], edges[0])
+        # A sketch's top edge may fall short of the padding
+        # score; it then belongs in the top bin:
+        self.store.pad_bin_ids[first_new_row:] = min(edges[0].searchsorted(self.PAD_SCORE), 
+                                                     self.NUM_BINS - 1)
+        return restyle
+
+    #------------------------------------
+    # rebin_moved
+    #-------------------
+    
+    def rebin_moved(self, prior_edges, edges, num_tokens):
+        '''
+        Update the bin ids of the first num_tokens words in
+        self.store after the global bin edges moved from 
+        prior_edges to edges. A word's bin id is the number
+        of edges below its score, so it changes only if an
+        edge moved across the score. Only those words are
+        re-binned. With exact bins they are looked up in 
+        self.score_index, by the range each edge moved over, 
+        in O(log^2 n) per edge plus the words found, and
+        without reading the store's scores. A sketch 
+        keeps memory bounded, so there is no index; the 
+        scores are then scanned, BIN_CHUNK_TOKENS at a time.
+        
+        :param prior_edges: edges the words were binned by
+        :type prior_edges: np.array
+        :param edges: new edges, as many as prior_edges
+        :type edges: np.array
+        :param num_tokens: number of words to update
+        :type num_tokens: int
+        '''
+        low  = np.minimum(prior_edges, edges)
+        high = np.maximum(prior_edges, edges)
+        moved = low != high
+        scores  = self.store.scores
+        bin_ids = self.store.bin_ids
+        if self.quantile_binner is None:
+            # Words in the ranges of several edges are 
+            # re-binned once per range, to the same bin:
+            for edge_low, edge_high in zip(low[moved].tolist(), high[moved].tolist()):
+                found_scores, positions = self.score_index.between(edge_low, edge_high)
+                binned = positions < num_tokens
+                bin_ids[positions[binned]] = QuantileBinner._bins_to_cuts(found_scores[binned], edges)
+            return
+        for chunk_start in range(0, num_tokens, self.BIN_CHUNK_TOKENS):
+            chunk_scores = scores[chunk_start:min(chunk_start + self.BIN_CHUNK_TOKENS, num_tokens)]
+            crossed = np.zeros(len(chunk_scores), dtype=bool)
+            for edge_low, edge_high in zip(low[moved].tolist(), high[moved].tolist()):
+                crossed |= (chunk_scores > edge_low) & (chunk_scores <= edge_high)
+            positions = np.flatnonzero(crossed)
+            bin_ids[chunk_start + positions] = QuantileBinner._bins_to_cuts(chunk_scores[positions], edges)
+
+    #------------------------------------
+    # compute_grouped_bins
+    #-------------------
+    
+    def compute_grouped_bins(self, first_new_row=0):
+        '''
+        Compute bins from the quantiles of each phrase's
+        scores (PHRASE scope), or of each group's scores
+        (GROUP scope). The edges of all groups are computed
+        in one vectorized pass by QuantileBinner.grouped_qcut(). 
+        
+        Per-phrase edges of existing phrases never change, 
+        so only phrases from first_new_row on are binned, 
+        about BIN_CHUNK_TOKENS words at a time; memory stays 
+        bounded, also for memory-mapped stores. For groups, 
+        all words are re-binned at once, and existing rows 
+        need restyling if the edges of a group they belong to 
+        moved. The GROUP scope therefore holds temporary 
+        arrays for all of the store's scores, even if the
+        store is memory-mapped. See compute_bins().
+        '''
+        store = self.store
+        if self.bin_scope == BinScopes.PHRASE:
+            offsets = store.offsets
+            row = first_new_row
+            while row < store.num_phrases:
+                # At least one phrase, however long:
+                end_row = max(row + 1, 
+                              int(offsets.searchsorted(offsets[row] + self.BIN_CHUNK_TOKENS, 
+                                                       side='right')) - 1)
+                end_row = min(end_row, store.num_phrases)
+                self.bin_phrase_groups(row, end_row, np.arange(end_row - row))
+                row = end_row
+            return first_new_row == 0
+        
+        edges = self.bin_phrase_groups(0, store.num_phrases, store.group_ids)
+        prior_edges = self.bin_edges
+        restyle = prior_edges is None or \
+                  not np.array_equal(edges[:len(prior_edges)], prior_edges, equal_nan=True)
+        self.bin_edges = edges
+        return restyle
+
+    #------------------------------------
+    # bin_phrase_groups
+    #-------------------
+    
+    def bin_phrase_groups(self, first_phrase, end_phrase, phrase_groups):
+        '''
+        Bin the words, and padding cells of the phrases from
+        first_phrase up to, excluding end_phrase by the quantiles
+        of their group's scores, in one vectorized pass of
+        QuantileBinner.grouped_qcut().
+        
+        :param first_phrase: index of the first phrase to bin
+        :type first_phrase: int
+        :param end_phrase: index past the last phrase to bin
+        :type end_phrase: int
+        :param phrase_groups: group number of each phrase,
+            from 0 up
+        :type phrase_groups: np.ndarray
+        :return upper bin edges of each group, one row per group
+        :rtype np.ndarray
+        '''
+        store = self.store
+        num_groups = phrase_groups.max() + 1 if len(phrase_groups) > 0 else 0
+        start, end = store.offsets[[first_phrase, end_phrase]].tolist()
+        scores  = store.scores[start:end]
+        lengths = np.diff(store.offsets[first_phrase:end_phrase + 1])
+        # As with global bins, a group with padded phrases
+        # has the padding score in its pool:
+        padded_groups = np.unique(phrase_groups[lengths < store.width])
+        x = np.concatenate((scores, np.full(len(padded_groups), self.PAD_SCORE)))
+        groups = np.concatenate((np.repeat(phrase_groups, lengths), padded_groups))
+        
+        bin_ids, edges = QuantileBinner.grouped_qcut(x, groups, self.NUM_BINS, num_groups)
+        store.bin_ids[start:end] = bin_ids[:len(scores)]
+        store.pad_bin_ids[first_phrase:end_phrase] = (edges[phrase_groups] < self.PAD_SCORE).sum(axis=1)
+        return edges
 
     #------------------------------------
     # prep_table
     #-------------------
     
     def prep_table(self):
+        '''
+        Recompute the quantile bins over all phrases, and
+        return a new, empty document. Rows may then be
+        added via render_rows(0).
         
-        # Get a list of all scores, across all phrases:
-        # np array of all_word_attributions is of shape (1, num_phrases, 2),
-        # where the 2-dimension holds the (word, attr_score). The squeeze
-        # removes the outer dim:
-        all_scores = self.all_word_attributions[:,:,1].astype(float)
-        all_words  = self.all_word_attributions[:,:,0]
-        self.bin_lookup = {}
-        for words_1phrase, bin_ids_1phrase in zip(all_words, 
-                                                  QuantileBinner.qcut(all_scores, 
-                                                                      self.NUM_BINS)):
-            self.bin_lookup.update({word : bin_id 
-                                    for word, bin_id 
-                                    in zip(words_1phrase, bin_ids_1phrase)})
+        :returns a document with style and empty table
+        :rtype dm.html
+        '''
+        self.bin_edges = None
+        self.compute_bins()
+        self.num_binned_rows = self.store.num_phrases
+        self.binned_width    = self.store.width
+        doc = self.create_doc()
+        self.num_rendered_rows = 0
+        return doc
 
+    #------------------------------------
+    # create_doc
+    #-------------------
+    
+    def create_doc(self):
+        '''
+        Create an HTML document with the style element
+        in the head, and an empty table in the body. The
+        table is available in self.tbl. 
+        
+        :returns a document with style and empty table
+        :rtype dm.html
+        '''
+        # Bin first: new bins would drop the document:
+        self.update_bins()
         doc = dm.html(dm.head(), dm.body())
         style = self.create_style()
         doc.head.appendChild(style)
-        self.tbl   = self.create_table_skeleton()
-        doc.body.appendChild(self.tbl)
+        self._tbl  = self.create_table_skeleton()
+        doc.body.appendChild(self._tbl)
         
         return doc
 
@@ -211,17 +1180,33 @@ class HTMLTable:
         :rtype: dm.HTMLStyleElement
         '''
         
-        style = dm.HTMLStyleElement('''
-              table, th, td {border: 1px solid;
-                             border-collapse: collapse;
-                            }
-              td {text-align:center;
-                  padding:10px;
-                 }
-              tr:nth-child(odd) {background-color: DarkGray;}
-        ''')
+        style = dm.HTMLStyleElement(self.style_sheet())
         return style
 
+    #------------------------------------
+    # style_sheet
+    #-------------------
+    
+    def style_sheet(self, css_classes=None):
+        '''
+        Return the CSS text of the document's style element:
+        STYLE_SHEET, followed by the word classes if the table
+        uses CSS classes.
+
+        :param css_classes: whether to include the word classes;
+            default is self.css_classes
+        :type css_classes: {None | bool}
+        :returns CSS text
+        :rtype str
+        '''
+        if css_classes is None:
+            css_classes = self.css_classes
+        if not css_classes:
+            return self.STYLE_SHEET
+        class_rules = '\n'.join(self.bin_styles(word_styling).style_rules
+                                for word_styling in WordStyles)
+        return f'{self.STYLE_SHEET}{class_rules}\n'
+
     #------------------------------------
     # create_table_skeleton
     #-------------------
@@ -239,314 +1224,3418 @@ class HTMLTable:
         return tbl
 
     #------------------------------------
-    # create_font_sized_words
+    # row_word_style
     #-------------------
     
-    def create_font_sized_words(self, word_attr_scores):
+    def row_word_style(self, row_num):
         '''
-        Return a list of domonic HTMLSpanElement. Each element of 
-        the list will be a <span> that styles the word's font size
-        to reflect its score.
-        
-        The arg is a list of (word, score) tuples that correspond
-        to one phrase. In addition, each span element will contain
-        a boolean attribute darken_background, which is set to False. 
-        This attr is used by the word color method only. 
-
-        Each HTMLSpanElement is ready to insert into a domonic html 
-        table cell.
+        Return how the words of the given phrase are styled.
         
-        :param word_attr_scores: list of (word, attributionScore) tuples
-        :type word_attr_scores: [(str, float)]
-        :returns list of html <span> snippets
-        :type [dm.HTMLSpanElement]
+        :param row_num: index of the phrase in self.store
+        :type row_num: int
+        :returns the phrase's word styling
+        :rtype WordStyles
         '''
-
-        # Map each word's logit score into one of NUM_BIN bins
-        output = []
-        for word, _attr_score in word_attr_scores: 
-            bin_id = self.bin_lookup[word]
-            # Each font step sizes fonts by 100%. I.e. 
-            # smallest is 100% of body font. Next size
-            # is 200% of body font, etc.
-            #*******font_perc = 100 + bin_id * 100
-            #*******font_perc = 100 + np.e**(bin_id/2) * 100
-            #*******font_perc = 100 + bin_id * 350
-            #*******font_perc = 100 + np.sqrt(3*bin_id)
-            #font_perc = 100 + 6**bin_id
-            font_perc = self.FONT_SIZE_LOOKUP[bin_id]
-            word_style = f'font-size:{font_perc}%;'
-            span_el = dm.HTMLSpanElement(word, style=word_style)
-            # No special table cell background coloring for thise
-            # word:
-            span_el.darken_background = False 
-            output.append(span_el)
-  
-        return output
+        return WordStyles(int(self.store.style_ids[row_num]))
 
     #------------------------------------
-    # create_colored_words
+    # styled_columns
     #-------------------
     
-    def create_colored_words(self, word_attr_scores):
+    def styled_columns(self, row_num):
         '''
-        Return a list of domonic HTMLSpanElement. Each element of 
-        the list will be a <span> that styles the word's color 
-        to reflect its score.
-        
-        The arg is a list of (word, score) tuples that correspond
-        to one phrase. In addition, each span element will contain
-        a boolean attribute darken_background. If true, the word
-        color is light enough that the caller should darken the
-        background on which the word will appear.
-
-        Each HTMLSpanElement is ready to insert into a domonic html 
-        table cell.
+        In the sparse rendering mode, i.e. if sparse_top_k or
+        sparse_min_bin is set, return which of the table's 
+        columns show a styled word for the given phrase: 
+        the sparse_top_k words with the largest absolute scores,
+        and the words binned into sparse_min_bin or higher. 
+        Padding cells are never styled. Return None if every
+        word is styled.
         
-        :param word_attr_scores: list of (word, attributionScore) tuples
-        :type word_attr_scores: [(str, float)]
-        :returns list of html <span> snippets
-        :type [dm.HTMLSpanElement]
+        :param row_num: index of the phrase in self.store
+        :type row_num: int
+        :returns one bool per column, or None
+        :rtype {None | np.ndarray}
         '''
-
-        # Pick a colormap; see https://matplotlib.org/3.5.1/tutorials/colors/colormaps.html:
-        cmap = matplotlib.cm.get_cmap(self.cmap_name)
-        
-        output = []
-        for word, _attr_score in word_attr_scores: 
-            bin_id = self.bin_lookup[word]
-            color  = (np.array(cmap(self.FONT_COLOR_LOOKUP[bin_id])) * 255).astype(int)
-            word_style = f'color:rgb{tuple(color)}; font-size:200%; font-weight:bold;'
-            span_el = dm.HTMLSpanElement(word, style=word_style)
-            # Is the color light enough that the background
-            # of the text should be darkened for visibility?
-            if self.DARKEN_BACKGROUND_THRES is not None and bin_id < self.DARKEN_BACKGROUND_THRES:
-                span_el.darken_background = True
+        if self.sparse_top_k is None and self.sparse_min_bin is None:
+            return None
+        _token_ids, scores = self.store.phrase(row_num)
+        num_words = len(scores)
+        styled = np.zeros(self.store.width, dtype=bool)
+        top_k = self.sparse_top_k
+        if top_k is not None and top_k > 0:
+            if top_k >= num_words:
+                styled[:num_words] = True
             else:
-                span_el.darken_background = False
-            output.append(span_el)
-
-        # Start REMOVE
-        # # Map logits to [0,1]:
-        # normed_mags = matplotlib.colors.Normalize(vmin=min(attr_scores), 
-        #                                           vmax=max(attr_scores))(attr_scores)
-        #
-        # # Pick colors from the colormap, proportional to logit value:
-        # colors = []
-        # for mag in normed_mags:
-        #     # Pick color from colormap, dropping the
-        #     # (always 255) opacity value:
-        #     colors.append(cmap(mag, bytes=True)[:3])
-        #
-        # # Get the whole phrase as HTML, escaping occurrences
-        # # of '<':
-        # # output = [f"<span title='{mag:0.3f}' style='margin: 1px; padding: 1px; border-radius: 4px; background: black; color: rgb{color};'>{word.replace('<', '&lt')}</span>"
-        # #           for word, color, mag
-        # #           in zip(words, colors, attr_mags)]
-        # # output = [f"<span title='{mag:0.3f}' style='color: rgb{color};'>{word.replace('<', '&lt')}</span>"
-        # #           for word, color, mag
-        # #           in zip(words, colors, attr_mags)]
-        # output = [dm.HTMLSpanElement(word.replace('<', '&lt'),
-        #             style=dm.HTMLStyleElement(f'id:{mag:0.3f}; color:rgb{color};'))
-        #           for word, color, mag
-        #           in zip(words, colors, attr_scores)]
-        # END REMOVE
-        return output
+                # Order among the top k does not matter, so a 
+                # partition suffices; NaN scores sort last:
+                styled[np.argpartition(-np.abs(scores), top_k - 1)[:top_k]] = True
+        if self.sparse_min_bin is not None:
+            self.update_bins()
+            styled[:num_words] |= self.store.phrase_bin_ids(row_num) >= self.sparse_min_bin
+        return styled
 
     #------------------------------------
-    # render_to_web
+    # styled_tokens
     #-------------------
     
-    def render_to_web(self):
+    def styled_tokens(self):
         '''
-        Given an HTML string, open the default browser, and
-        display the string there.
+        Return whether each word in self.store is styled
+        in the sparse rendering mode; see styled_columns().
         
-        The name of a temp file is returned. It will be be
-        deleted automatically upon garbage collection.
-    
-        :param output: HTML to display
-        :type output: str
-        :return temp file path
-        :rtype str
+        :returns one bool per word
+        :rtype np.ndarray
         '''
-        fd = tempfile.NamedTemporaryFile(prefix='attrs_', suffix='.html')
-        fd.write(bytes('<html>', 'utf8'))
-        fd.write(bytes(str(self.doc), 'utf8'))
-        fd.write(bytes('</html>', 'utf8'))
-        fd.flush()
-        webbrowser.open_new_tab(f"file://{fd.name}")
-        # Terrible hack! Must ensure the browser has read
-        # the file before removing the temp file. The right
-        # way would be to check for presence of some page
-        # element:
-        time.sleep(5)
-        return fd.name
-    
+        styled = np.empty(self.store.num_tokens, dtype=bool)
+        offsets = self.store.offsets.tolist()
+        for row_num in range(self.store.num_phrases):
+            start, end = offsets[row_num], offsets[row_num + 1]
+            styled[start:end] = self.styled_columns(row_num)[:end - start]
+        return styled
+
     #------------------------------------
-    # canonicalize_word_attr
+    # styled_runs
     #-------------------
     
-    def canonicalize_word_attr(self, word_attribution):
+    def styled_runs(self, styled):
         '''
-        Given one word/score pair, modify the word or
-        attribution score for use with HTML.
+        Split the columns into runs of all styled, or all
+        plain columns.
         
-        :param word_attribution: word/attribution_score to clean
-        :type word_attribution: (str, {str | float | int})
-        :return an HTML-safe tuple
-        :rtype (str, float)
+        :param styled: one bool per column; see styled_columns()
+        :type styled: np.ndarray
+        :returns (start column, end column, whether styled) of 
+            each run
+        :rtype [(int, int, bool)]
         '''
-        word, score = word_attribution
-        # Replace HTML tag opener token:
-        return (word.replace('<', '&lt'), float(score))
+        if len(styled) == 0:
+            return []
+        boundaries = (np.flatnonzero(styled[1:] != styled[:-1]) + 1).tolist()
+        starts = [0] + boundaries
+        ends   = boundaries + [len(styled)]
+        return [(start, end, bool(styled[start])) for start, end in zip(starts, ends)]
 
     #------------------------------------
-    # adjust_table_width
+    # padded_bin_ids
     #-------------------
     
-    def adjust_table_width(self, new_phrase_data):
-        
-        _num_phrases, phrase_width, _tuple_len = new_phrase_data.shape
-        _num_all_phrases, all_phrase_width, _tuple_len = self.all_word_attributions.shape
-        
-        if phrase_width == all_phrase_width:
-            return new_phrase_data
+    def padded_bin_ids(self, phrase_num):
+        '''
+        Return the bin ids of one phrase's words, padded
+        with the padding bin to the table width. 
         
-        if all_phrase_width < phrase_width:
-            # Widen the already existing table:
-            for _i in range(phrase_width - all_phrase_width):
-                self.all_word_attributions = np.hstack((self.all_word_attributions, 
-                                                        [[('','0')]]))
+        :param phrase_num: index of the phrase in self.store
+        :type phrase_num: int
+        :returns bin id of each word
+        :rtype np.ndarray
+        '''
+        self.update_bins()
+        bin_ids = self.store.phrase_bin_ids(phrase_num)
+        num_pads = self.store.width - len(bin_ids)
+        if num_pads == 0:
+            return bin_ids
+        return np.concatenate((bin_ids, 
+                               np.full(num_pads, self.store.pad_bin_ids[phrase_num], dtype=bin_ids.dtype)))
+
+    #------------------------------------
+    # bin_styles_key
+    #-------------------
+    
+    def bin_styles_key(self, word_styling):
+        '''
+        Return the settings that determine the BinStyles
+        of a word styling.
+        
+        :param word_styling: styling whose settings to return
+        :type word_styling: WordStyles
+        :returns hashable settings
+        :rtype tuple
+        '''
+        return (word_styling, 
+                self.NUM_BINS, 
+                self.cmap_name,
+                tuple(self.FONT_COLOR_LOOKUP.items()),
+                tuple(self.FONT_SIZE_LOOKUP.items()),
+                self.DARKEN_BACKGROUND_THRES,
+                self.DARK_BACKGROUND,
+                self.CSS_CLASS_PREFIXES[word_styling])
+
+    #------------------------------------
+    # bin_styles
+    #-------------------
+    
+    def bin_styles(self, word_styling):
+        '''
+        Return the BinStyles for the given word styling. The
+        per-bin CSS is computed once per colormap, bin count,
+        and lookup tables, and then cached.
+        
+        :param word_styling: styling for which to return bin styles
+        :type word_styling: WordStyles
+        :returns CSS for each bin
+        :rtype BinStyles
+        '''
+        key = self.bin_styles_key(word_styling)
+        try:
+            return self.bin_styles_cache[key]
+        except KeyError:
+            pass
+        
+        bin_ids = range(self.NUM_BINS)
+        if word_styling == WordStyles.FONT_SIZE:
+            # Each font step sizes fonts by 100%. I.e. 
+            # smallest is 100% of body font. Next size
+            # is 200% of body font, etc.
+            #*******font_perc = 100 + bin_id * 100
+            #*******font_perc = 100 + np.e**(bin_id/2) * 100
+            #*******font_perc = 100 + bin_id * 350
+            #*******font_perc = 100 + np.sqrt(3*bin_id)
+            #font_perc = 100 + 6**bin_id
+            word_styles = [f'font-size:{self.FONT_SIZE_LOOKUP[bin_id]}%;' 
+                           for bin_id in bin_ids]
+            # No special table cell background coloring for
+            # font sized words:
+            darken_background = [False] * self.NUM_BINS
+        elif word_styling == WordStyles.FONT_COLOR:
+            # One RGBA row per bin:
+            colors = self.font_colors([self.FONT_COLOR_LOOKUP[bin_id] for bin_id in bin_ids])
+            word_styles = [f"color:rgb({', '.join(str(channel) for channel in color)}); "
+                           f"font-size:200%; font-weight:bold;"
+                           for color in colors]
+            # Is the color light enough that the background
+            # of the text should be darkened for visibility?
+            darken_background = [self.DARKEN_BACKGROUND_THRES is not None and 
+                                 bin_id < self.DARKEN_BACKGROUND_THRES
+                                 for bin_id in bin_ids]
         else:
-            # Widen the new phrase:
-            for _i in range(all_phrase_width - phrase_width):
-                new_phrase_data = np.hstack((new_phrase_data,
-                                                  [[('','0')]]))
-        return new_phrase_data
+            raise ValueError(f'Bad word style: {word_styling}')
         
+        bin_styles = BinStyles(word_styles, 
+                               darken_background, 
+                               self.DARK_BACKGROUND,
+                               self.CSS_CLASS_PREFIXES[word_styling])
+        self.bin_styles_cache[key] = bin_styles
+        return bin_styles
 
-# ------------------- Class Binner ------------   
+    #------------------------------------
+    # font_colors
+    #-------------------
+    
+    def font_colors(self, cmap_fractions):
+        '''
+        Return the RGBA colors, 0 to 255, at the given
+        fractions of the width of the colormap self.cmap_name.
+        Colors are taken from FONT_COLOR_RGBA when there, so
+        that matplotlib is only imported for other colormaps
+        or fractions.
+        
+        :param cmap_fractions: positions in the colormap, 0 to 1
+        :type cmap_fractions: [float]
+        :returns one [r, g, b, a] list per fraction
+        :rtype [[int]]
+        '''
+        try:
+            return [list(color) 
+                    for color in self.FONT_COLOR_RGBA[(self.cmap_name, tuple(cmap_fractions))]]
+        except KeyError:
+            pass
+        # Pick a colormap; see https://matplotlib.org/3.5.1/tutorials/colors/colormaps.html:
+        cmap = matplotlib.colormaps[self.cmap_name]
+        return (cmap(np.array(cmap_fractions)) * 255).astype(int).tolist()
 
-class Binner:
+    #------------------------------------
+    # phrase_styles
+    #-------------------
+    
+    def phrase_styles(self, phrase_num, word_styling=None):
+        '''
+        Return (word, word_style, darken_background) triplets
+        for the words of one phrase, padded to the table width.
+        Styles are gathered from the per-bin BinStyles by 
+        the words' bin ids.
+        
+        :param phrase_num: index of the phrase in self.store
+        :type phrase_num: int
+        :param word_styling: styling to use; default is the 
+            phrase's own styling
+        :type word_styling: {None | WordStyles}
+        :returns one triplet per word
+        :rtype [(str, str, bool)]
+        '''
+        if word_styling is None:
+            word_styling = self.row_word_style(phrase_num)
+        bin_styles = self.bin_styles(word_styling)
+        bin_ids = self.padded_bin_ids(phrase_num)
+        words, _scores = self.padded_phrase(phrase_num)
+        return list(zip(words, 
+                        bin_styles.word_styles[bin_ids].tolist(),
+                        bin_styles.darken_background[bin_ids].tolist()))
 
     #------------------------------------
-    # Constructor
+    # create_span
+    #-------------------
+    
+    def create_span(self, word, word_style, darken_background):
+        '''
+        Return a domonic HTMLSpanElement for one word. The
+        span will carry a boolean attribute darken_background. 
+        If true, the caller should darken the background on which 
+        the word will appear.
+        
+        :param word: word to show
+        :type word: str
+        :param word_style: CSS style of the word
+        :type word_style: str
+        :param darken_background: whether the cell background
+            is to be darkened 
+        :type darken_background: bool
+        :returns html <span> element
+        :rtype dm.HTMLSpanElement
+        '''
+        span_el = dm.HTMLSpanElement(word, style=word_style)
+        span_el.darken_background = darken_background
+        return span_el
+
+    #------------------------------------
+    # create_font_sized_words
     #-------------------
+    
+    def create_font_sized_words(self, phrase_num):
+        '''
+        Return a list of domonic HTMLSpanElement. Each element of 
+        the list will be a <span> that styles the word's font size
+        to reflect its score.
+        
+        The arg is the index of one phrase in self.store. The
+        phrase is padded to the table width. In addition, each span 
+        element will contain a boolean attribute darken_background, 
+        which is set to False. This attr is used 
+        by the word color method only. 
 
-    def __init__(self, in_range, out_range, num_bins):
+        Each HTMLSpanElement is ready to insert into a domonic html 
+        table cell.
         
-        self.in_min, self.in_max   = in_range
-        self.out_min, self.out_max = out_range
-        self.create_bins(num_bins)
+        :param phrase_num: index of the phrase in self.store
+        :type phrase_num: int
+        :returns list of html <span> snippets
+        :type [dm.HTMLSpanElement]
+        '''
+        return [self.create_span(word, word_style, darken_background)
+                for word, word_style, darken_background
+                in self.phrase_styles(phrase_num, WordStyles.FONT_SIZE)]
 
     #------------------------------------
-    # select_bin
+    # create_colored_words
     #-------------------
+    
+    def create_colored_words(self, phrase_num):
+        '''
+        Return a list of domonic HTMLSpanElement. Each element of 
+        the list will be a <span> that styles the word's color 
+        to reflect its score.
+        
+        The arg is the index of one phrase in self.store. The
+        phrase is padded to the table width. In addition, each span 
+        element will contain a boolean attribute darken_background. 
+        If true, the word color is light enough 
+        that the caller should darken the background on which the 
+        word will appear.
 
-    def select_bin(self, in_value):
+        Each HTMLSpanElement is ready to insert into a domonic html 
+        table cell.
         
-        val = self.map_range(in_value)
-        for bin_id, _bin in enumerate(self.bins):
-            bin_low, bin_high = _bin
-            if val >= bin_low and val < bin_high:
-                return bin_id
-        return -1
+        :param phrase_num: index of the phrase in self.store
+        :type phrase_num: int
+        :returns list of html <span> snippets
+        :type [dm.HTMLSpanElement]
+        '''
+        return [self.create_span(word, word_style, darken_background)
+                for word, word_style, darken_background
+                in self.phrase_styles(phrase_num, WordStyles.FONT_COLOR)]
 
     #------------------------------------
-    # map_range
+    # iter_html
     #-------------------
-     
-    def map_range(self, value):
-        if value >= self.out_min and value < self.out_max:
-            return value
-        if value < self.in_min or value > self.in_max:
-            raise IndexError(f"Value {value} not in [{self.bins[0][0]}, {self.bins[-1][1]})")
-        return self.out_min + (((value - self.in_min) / (self.in_max - self.in_min)) * (self.out_max - self.out_min))
+    
+    def iter_html(self):
+        '''
+        Generator that yields the table's HTML in chunks: the 
+        document head, one chunk per row-pair, and the document
+        tail. The concatenated chunks equal str(self.doc), but 
+        no domonic elements are created.
+        
+        :returns generator of HTML strings
+        :rtype Iterator[str]
+        '''
+        yield self.html_head()
+        for row_num in range(self.store.num_phrases):
+            yield self.row_pair_html(row_num)
+        yield self.html_tail()
 
     #------------------------------------
-    # create_bins
+    # html_head
     #-------------------
     
-    def create_bins(self, num_bins):
+    def html_head(self, pager=''):
+        '''
+        Return the document's HTML up to and including
+        the opening <table> tag.
+        
+        :param pager: HTML to show above the table
+        :type pager: str
+        :returns start of the HTML document
+        :rtype str
+        '''
+        return f'<html><head><style>{self.style_sheet()}</style></head><body>{pager}<table>'
 
-        bins = []
-        width = (self.out_max - self.out_min) / num_bins 
+    #------------------------------------
+    # html_tail
+    #-------------------
+    
+    def html_tail(self, pager=''):
+        '''
+        Return the document's HTML from the closing
+        </table> tag on.
         
-        low = self.out_min
-        while low < self.out_max:
-            bins.append((low, low+width))
-            low += width
-        # Make the last bin inclusive of the max 
-        # val of out-range. I.e. make the max out 
-        # range value satisfy "< last_box_high":
-        bins[-1] = (bins[-1][0], bins[-1][1] + 0.0001)
-        self.bins = bins
+        :param pager: HTML to show below the table
+        :type pager: str
+        :returns end of the HTML document
+        :rtype str
+        '''
+        return f'</table>{pager}</body></html>'
 
-# ------------------- Class QuantileBinner ----------
+    #------------------------------------
+    # num_pages
+    #-------------------
+    
+    def num_pages(self, rows_per_page):
+        '''
+        Return the number of pages needed to show all
+        phrases with rows_per_page row-pairs per page.
+        
+        :param rows_per_page: maximum number of phrases per page
+        :type rows_per_page: int
+        :returns number of pages
+        :rtype int
+        '''
+        if rows_per_page < 1:
+            raise ValueError(f'Rows per page must be at least 1, not {rows_per_page}')
+        return max(1, -(-self.store.num_phrases // rows_per_page))
 
-class QuantileBinner:
+    #------------------------------------
+    # iter_page_html
+    #-------------------
     
-    @staticmethod
-    def qcut(x, bin_info):
-        """
-        Quantile-based discretization function.
-        Discretize variable into equal-sized buckets based on sample quantiles. 
-        For example 1000 values for 10 quantiles would
-        produce a Categorical object indicating quantile membership for each data point.
+    def iter_page_html(self, page_num, rows_per_page, page_name=None):
+        '''
+        Generator like iter_html(), but for only one page
+        of at most rows_per_page row-pairs. Pages are numbered 
+        from 0. Above and below the table, the page links to
+        the first, previous, next, and last pages, which are
+        expected in the same directory, named by the format 
+        string page_name (default: self.PAGE_NAME).
         
-        Returns
-        -------
-        out : Categorical or Series or array of integers if labels is False
-            The return type (Categorical or Series) depends on the input: a Series
-            of type category if input is a Series else Categorical. Bins are
-            represented as categories when categorical data is returned.
-        bins : ndarray of floats
-            Returned only if `retbins` is True.
-        Notes
-        -----
-        Out of bounds values will be NA in the resulting Categorical object
-        Examples
-        --------
-        >>> pd.qcut(range(5), 4)
-        ... # doctest: +ELLIPSIS
-        [(-0.001, 1.0], (-0.001, 1.0], (1.0, 2.0], (2.0, 3.0], (3.0, 4.0]]
-        Categories (4, interval[float64, right]): [(-0.001, 1.0] < (1.0, 2.0] ...
-        >>> pd.qcut(range(5), 3, labels=["good", "medium", "bad"])
-        ... # doctest: +SKIP
-        [good, good, medium, bad, bad]
-        Categories (3, object): [good < medium < bad]
-        >>> pd.qcut(range(5), 4, labels=False)
-        array([0, 0, 1, 2, 3])
-        """
-        x_np = np.asarray(x)
-        x_np.sort()
-        x_np = np.unique(x_np)
-        x_np = x_np[~np.isnan(x_np)]
+        All pages share the table's bin edges, so a
+        word is styled the same on its page as it is in
+        the full table.
+        
+        :param page_num: index of the page
+        :type page_num: int
+        :param rows_per_page: maximum number of phrases per page
+        :type rows_per_page: int
+        :param page_name: file name format of the pages
+        :type page_name: {None | str}
+        :returns generator of HTML strings
+        :rtype Iterator[str]
+        '''
+        num_pages = self.num_pages(rows_per_page)
+        if not 0 <= page_num < num_pages:
+            raise IndexError(f'Page {page_num} out of range for {num_pages} pages')
         
-        # the +1 replaces the zeroeth percentile, which is
-        # removed by the [1:]:
-        quantiles = np.linspace(0, 1, bin_info + 1)[1:] if type(bin_info) == int else bin_info
+        first_row = page_num * rows_per_page
+        end_row   = min(first_row + rows_per_page, self.store.num_phrases)
+        pager = self.pager_html(page_num, num_pages, first_row, end_row, page_name)
         
-        bins = np.quantile(x_np, quantiles)
+        yield self.html_head(pager)
+        for row_num in range(first_row, end_row):
+            yield self.row_pair_html(row_num)
+        yield self.html_tail(pager)
+
+    #------------------------------------
+    # pager_html
+    #-------------------
     
-        ids = QuantileBinner._bins_to_cuts(x, bins)
+    def pager_html(self, page_num, num_pages, first_row, end_row, page_name=None):
+        '''
+        Return the navigation bar of one page.
+        
+        :param page_num: index of the page
+        :type page_num: int
+        :param num_pages: total number of pages
+        :type num_pages: int
+        :param first_row: index of the page's first phrase
+        :type first_row: int
+        :param end_row: index past the page's last phrase
+        :type end_row: int
+        :param page_name: file name format of the pages
+        :type page_name: {None | str}
+        :returns HTML of the navigation bar
+        :rtype str
+        '''
+        if page_name is None:
+            page_name = self.PAGE_NAME
+        
+        def link(text, target_page):
+            if target_page == page_num or not 0 <= target_page < num_pages:
+                return text
+            href = page_name.format(target_page + 1).translate(ATTR_ESCAPES)
+            return f'<a href="{href}">{text}</a>'
+        
+        position = (f'Page {page_num + 1} of {num_pages} '
+                    f'(phrases {first_row + 1}-{end_row} of {self.store.num_phrases})')
+        return (f"<p>{link('first', 0)} | {link('previous', page_num - 1)} | "
+                f"{position} | "
+                f"{link('next', page_num + 1)} | {link('last', num_pages - 1)}</p>")
+
+    #------------------------------------
+    # write_pages
+    #-------------------
     
-        return ids
+    def write_pages(self, out_dir, rows_per_page=1000, page_name=None):
+        '''
+        Write the table as a sequence of linked HTML files
+        in out_dir, each holding at most rows_per_page 
+        row-pairs. Browsers lay out tables of tens of thousands
+        of rows slowly; pages keep every file small. The 
+        directory is created if needed. Returns the paths of 
+        the written pages; the first is the one to open.
+        
+        :param out_dir: directory for the page files
+        :type out_dir: str
+        :param rows_per_page: maximum number of phrases per page
+        :type rows_per_page: int
+        :param page_name: file name format of the pages
+        :type page_name: {None | str}
+        :returns paths of the page files
+        :rtype [str]
+        '''
+        if page_name is None:
+            page_name = self.PAGE_NAME
+        os.makedirs(out_dir, exist_ok=True)
+        
+        paths = []
+        for page_num in range(self.num_pages(rows_per_page)):
+            path = os.path.join(out_dir, page_name.format(page_num + 1))
+            with open(path, 'w', encoding='utf8') as fd:
+                for chunk in self.iter_page_html(page_num, rows_per_page, page_name):
+                    fd.write(chunk)
+            paths.append(path)
+        return paths
+
+    #------------------------------------
+    # row_pair_html
+    #-------------------
     
-    @staticmethod
-    def _bins_to_cuts(x, unique_bins):
+    def row_pair_html(self, row_num):
         '''
+        Return the HTML of the two table rows for one phrase:
+        the styled words, and the scores.
         
-        :param x: sorted array of numbers that are to be assigned
-            into bins
-        :type x: np.array
-        :param unique_bins: either a single int generate quantiles,
-            or a list of quantiles
-        :type unique_bins: {int | [float]}
-        :return
-        :rtype
+        :param row_num: index of the phrase in self.store
+        :type row_num: int
+        :returns HTML of a row-pair
+        :rtype str
         '''
+        if self.render_cache is None:
+            return self.render_row_pair(row_num)
+        key = self.row_pair_key(row_num)
+        row_pair = self.render_cache.get(key)
+        if row_pair is None:
+            row_pair = self.render_row_pair(row_num)
+            self.render_cache.put(key, row_pair)
+        return row_pair
+
+    #------------------------------------
+    # render_row_pair
+    #-------------------
     
-        ids = unique_bins.searchsorted(x)
-        return ids
+    def render_row_pair(self, row_num):
+        '''
+        Return the HTML of one phrase's row-pair, as 
+        row_pair_html() does, but never from the render cache.
+        
+        :param row_num: index of the phrase in self.store
+        :type row_num: int
+        :returns HTML of a row-pair
+        :rtype str
+        '''
+        bin_styles = self.bin_styles(self.row_word_style(row_num))
+        openers = bin_styles.class_openers if self.css_classes else bin_styles.cell_openers
+        styled = self.styled_columns(row_num)
+        if styled is None:
+            cell_openers = openers[self.padded_bin_ids(row_num)].tolist()
+            words, scores = self.padded_phrase(row_num)
+            word_cells  = [f'{cell_opener}{word}</span></td>' 
+                           for cell_opener, word in zip(cell_openers, words)]
+            score_cells = [f'<td>{round(score,2)}</td>' for score in scores]
+            return f"<tr>{''.join(word_cells)}</tr><tr>{''.join(score_cells)}</tr>"
+        
+        # Padding is never styled, and plain runs leave it
+        # out, so only the words are needed; openers and 
+        # scores only for the styled ones:
+        self.update_bins()
+        token_ids, scores = self.store.phrase(row_num)
+        words = self.store.words(token_ids)
+        styled_cols = np.flatnonzero(styled)
+        styled_openers = openers[self.store.phrase_bin_ids(row_num)[styled_cols]].tolist()
+        styled_scores  = scores[styled_cols].tolist()
+        
+        # Between styled columns, the plain words are 
+        # joined into one cell per run:
+        word_cells  = []
+        score_cells = []
+        run_start = 0
+        for col, cell_opener, score in zip(styled_cols.tolist(), styled_openers, styled_scores):
+            if col > run_start:
+                colspan = f' colspan="{col - run_start}"' if col - run_start > 1 else ''
+                word_cells.append(f"<td{colspan}>{' '.join(words[run_start:col])}</td>")
+                score_cells.append(f'<td{colspan}></td>')
+            word_cells.append(f'{cell_opener}{words[col]}</span></td>')
+            score_cells.append(f'<td>{round(score,2)}</td>')
+            run_start = col + 1
+        width = self.store.width
+        if width > run_start:
+            colspan = f' colspan="{width - run_start}"' if width - run_start > 1 else ''
+            word_cells.append(f"<td{colspan}>{' '.join(words[run_start:])}</td>")
+            score_cells.append(f'<td{colspan}></td>')
+        return f"<tr>{''.join(word_cells)}</tr><tr>{''.join(score_cells)}</tr>"
+
+    #------------------------------------
+    # row_pair_key
+    #-------------------
+    
+    def row_pair_key(self, row_num):
+        '''
+        Return the render cache key of one phrase's row-pair:
+        a hash of its words, scores, and padded bin ids, of 
+        the table width, of the word styling and its settings,
+        and of the other settings that row_pair_html() uses.
+        Keys depend on words, not on token ids, so they are
+        the same in any table.
+        
+        :param row_num: index of the phrase in self.store
+        :type row_num: int
+        :returns hex digest
+        :rtype str
+        '''
+        token_ids, scores = self.store.phrase(row_num)
+        settings = (self.ROW_PAIR_FORMAT,
+                    self.bin_styles_key(self.row_word_style(row_num)),
+                    self.css_classes,
+                    self.sparse_top_k,
+                    self.sparse_min_bin,
+                    self.store.width,
+                    self.PAD_WORD,
+                    self.PAD_SCORE)
+        try:
+            digest = self.row_pair_digests[settings].copy()
+        except KeyError:
+            digest = hashlib.blake2b(repr(settings).encode('utf8'), digest_size=16)
+            self.row_pair_digests[settings] = digest.copy()
+        # The repr of a list of strings is unambiguous:
+        digest.update(repr(self.store.words(token_ids)).encode('utf8'))
+        digest.update(np.asarray(scores, dtype='<f8').tobytes())
+        digest.update(np.asarray(self.padded_bin_ids(row_num), dtype='<i2').tobytes())
+        return digest.hexdigest()
+
+    #------------------------------------
+    # iter_payload_html
+    #-------------------
+
+    def iter_payload_html(self):
+        '''
+        Generator that yields, in chunks, an HTML document
+        that holds the table as data rather than as rows: the
+        bin class names as JSON, the vocabulary as the base64
+        encoding of its UTF-8, NUL-separated words, and the
+        store's offsets, token ids, bin ids, scores, padding
+        bin ids, and word stylings as base64-encoded little-endian
+        typed arrays; in the sparse mode also whether each word
+        is styled. The browser decodes the vocabulary in one 
+        pass. NUL characters in words, which browsers show as
+        U+FFFD anyway, are sent as U+FFFD. Scores are rounded to two decimals, as
+        they are shown. The embedded PAYLOAD_SCRIPT builds
+        the row-pairs in the browser, a few hundred at a time
+        as the user scrolls.
+
+        Each token costs about 20 bytes of payload, instead
+        of the 100 and more bytes of its cells, and no per-word
+        HTML is generated in Python. Words are styled by CSS
+        classes, whatever self.css_classes.
+
+        :returns generator of HTML strings
+        :rtype Iterator[str]
+        '''
+        self.update_bins()
+        store = self.store
+        # Class names by word styling value, then bin id:
+        class_names = [self.bin_styles(word_styling).class_names.tolist()
+                       for word_styling in sorted(WordStyles, key=lambda style: style.value)]
+        header = {'num_phrases'    : store.num_phrases,
+                  'width'          : store.width,
+                  'pad_word'       : self.PAD_WORD,
+                  'pad_score'      : self.PAD_SCORE,
+                  'rows_per_chunk' : self.PAYLOAD_ROWS_PER_CHUNK,
+                  'class_names'    : class_names
+                  }
+        # Leave the JSON object open for the arrays. Within
+        # a <script> element, '</' could end the element:
+        header_json = json.dumps(header)[:-1].replace('</', '<\\/')
+        yield (f'<html><head><style>{self.style_sheet(css_classes=True)}</style></head><body>'
+               f'<table><tbody id="nlpviz-rows"></tbody></table><div id="nlpviz-more"></div>'
+               f'<script type="application/json" id="nlpviz-data">'
+               f'{header_json}')
+        vocab_utf8 = '\x00'.join([word.replace('\x00', '\ufffd') for word in store.vocab]).encode('utf8')
+        arrays = (('vocab',       np.frombuffer(vocab_utf8, dtype=np.uint8), '<u1'),
+                  ('offsets',     store.offsets,     '<f8'),
+                  ('token_ids',   store.token_ids,   '<i4'),
+                  ('bin_ids',     store.bin_ids,     '<i2'),
+                  ('scores',      store.scores,      '<f8'),
+                  ('pad_bin_ids', store.pad_bin_ids, '<i2'),
+                  ('style_ids',   store.style_ids,   '<i1'))
+        if self.sparse_top_k is not None or self.sparse_min_bin is not None:
+            arrays += (('styled', self.styled_tokens(), '<u1'),)
+        for name, arr, dtype in arrays:
+            yield f', "{name}": "'
+            yield from self._iter_base64(arr, dtype, decimals=2 if name == 'scores' else None)
+            yield '"'
+        yield f'}}</script><script>{self.PAYLOAD_SCRIPT}</script></body></html>'
+
+    #------------------------------------
+    # _iter_base64
+    #-------------------
+
+    def _iter_base64(self, arr, dtype, decimals=None):
+        '''
+        Yield the base64 encoding of arr as the given dtype,
+        PAYLOAD_CHUNK_ITEMS elements at a time, so that only
+        one chunk is ever copied.
+
+        :param arr: array to encode
+        :type arr: np.ndarray
+        :param dtype: type of the encoded elements
+        :type dtype: str
+        :param decimals: if given, elements are first rounded
+            to this many decimals
+        :type decimals: {None | int}
+        :returns generator of base64 strings
+        :rtype Iterator[str]
+        '''
+        for start in range(0, len(arr), self.PAYLOAD_CHUNK_ITEMS):
+            chunk = np.asarray(arr[start:start + self.PAYLOAD_CHUNK_ITEMS], dtype=dtype)
+            if decimals is not None:
+                chunk = self._round(chunk, decimals)
+            yield base64.b64encode(chunk.tobytes()).decode('ascii')
+
+    #------------------------------------
+    # _round
+    #-------------------
+
+    def _round(self, values, decimals):
+        '''
+        Return the float values rounded the way Python's
+        round() rounds them, which is how row_pair_html()
+        shows scores. np.round() scales by 10**decimals,
+        which misrounds some values close to a half; only
+        those, and huge values, are rounded in Python.
+
+        :param values: values to round
+        :type values: np.ndarray
+        :param decimals: number of decimals to keep
+        :type decimals: int
+        :returns rounded values
+        :rtype np.ndarray
+        '''
+        rounded = np.round(values, decimals)
+        scaled  = np.abs(values) * 10.**decimals
+        doubtful = (np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6) | (scaled >= 2.**40)
+        for i in np.flatnonzero(doubtful).tolist():
+            rounded[i] = round(float(values[i]), decimals)
+        return rounded
+
+    #------------------------------------
+    # write_to
+    #-------------------
+    
+    def write_to(self, fileobj, backend=RenderBackends.STREAM):
+        '''
+        Write the table's HTML document to an open file, 
+        socket file (see socket.makefile()), or other file-like 
+        object. Binary file objects receive UTF-8. With the STREAM
+        backend the document is written chunk by chunk, without 
+        ever holding the whole document in memory. The DOMONIC 
+        backend writes str(self.doc). The PAYLOAD backend writes
+        the document of iter_payload_html(), whose rows the
+        browser builds.
+        
+        :param fileobj: where to write the document
+        :type fileobj: {io.TextIOBase | io.BufferedIOBase | tempfile.NamedTemporaryFile}
+        :param backend: how to produce the HTML
+        :type backend: RenderBackends
+        '''
+        if type(backend) != RenderBackends:
+            raise ValueError(f'Bad render backend: {backend}')
+        
+        if backend == RenderBackends.STREAM:
+            chunks = self.iter_html()
+        elif backend == RenderBackends.PAYLOAD:
+            chunks = self.iter_payload_html()
+        else:
+            chunks = [str(self.doc)]
+        
+        # Wrappers such as tempfile.NamedTemporaryFile are
+        # no io classes, but carry the mode of their file:
+        binary = isinstance(fileobj, (io.RawIOBase, io.BufferedIOBase)) or \
+                 'b' in getattr(fileobj, 'mode', '')
+        for chunk in chunks:
+            fileobj.write(chunk.encode('utf8') if binary else chunk)
+
+    #------------------------------------
+    # to_html
+    #-------------------
+    
+    def to_html(self, backend=RenderBackends.STREAM):
+        '''
+        Return the table's HTML document as a string.
+        
+        :param backend: how to produce the HTML
+        :type backend: RenderBackends
+        :returns HTML document
+        :rtype str
+        '''
+        buf = io.StringIO()
+        self.write_to(buf, backend)
+        return buf.getvalue()
+
+    #------------------------------------
+    # render
+    #-------------------
+    
+    def render(self, workers=1, chunks_per_worker=4):
+        '''
+        Return the table's HTML document as a string, like 
+        to_html(), optionally rendering the row-pairs in 
+        multiple processes. The bin ids of all words are
+        already in self.store, so workers only turn slices
+        of consecutive phrases into HTML fragments. The 
+        fragments are joined in phrase order, making the 
+        result identical to that of to_html().
+        
+        Workers receive the table's settings once, and 
+        with each task a copy of only the phrases to render 
+        (see PhraseStore.take()), so that each word is sent
+        once, also from memory-mapped stores. Row-pairs in
+        the render cache are taken from it in this process,
+        and the others added to it. Worth it only for tables
+        with many thousands of words, and as many cores as
+        workers.
+        
+        :param workers: number of worker processes; 1 renders
+            in this process
+        :type workers: int
+        :param chunks_per_worker: number of phrase slices per
+            worker, for balancing the load
+        :type chunks_per_worker: int
+        :returns HTML document
+        :rtype str
+        '''
+        num_phrases = self.store.num_phrases
+        if workers <= 1 or num_phrases < 2:
+            return self.to_html()
+        
+        from concurrent.futures import ProcessPoolExecutor
+        
+        self.update_bins()
+        # Row-pairs by phrase; those in the render cache 
+        # are looked up here, so that its counts and memory
+        # tier stay in this process:
+        row_pairs = [None] * num_phrases
+        keys = None
+        if self.render_cache is not None:
+            keys = [self.row_pair_key(row_num) for row_num in range(num_phrases)]
+            row_pairs = [self.render_cache.get(key) for key in keys]
+        to_render = [row_num for row_num, row_pair in enumerate(row_pairs) if row_pair is None]
+        if not to_render:
+            return ''.join([self.html_head(), *row_pairs, self.html_tail()])
+        num_chunks = min(len(to_render), workers * chunks_per_worker)
+        boundaries = np.linspace(0, len(to_render), num_chunks + 1).astype(int).tolist()
+        
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_render_worker,
+                                 initargs=(self.render_template(),)) as pool:
+            # Each task carries a copy of only its phrases; 
+            # at most two per worker are pending at a time:
+            pending = collections.deque()
+            for start, end in zip(boundaries[:-1], boundaries[1:]):
+                row_nums = to_render[start:end]
+                pending.append((row_nums, pool.submit(_render_row_pairs, self.store.take(row_nums))))
+                while pending and (len(pending) > 2 * workers or end == len(to_render)):
+                    row_nums, future = pending.popleft()
+                    for row_num, row_pair in zip(row_nums, future.result()):
+                        row_pairs[row_num] = row_pair
+                        if keys is not None:
+                            self.render_cache.put(keys[row_num], row_pair)
+        return ''.join([self.html_head(), *row_pairs, self.html_tail()])
+
+    #------------------------------------
+    # render_template
+    #-------------------
+    
+    def render_template(self):
+        '''
+        Return a copy of this table for render() to send 
+        to its worker processes: with the settings that 
+        rendering uses, but without phrases, document, 
+        binners, render cache, or instrumentation wrappers.
+        Workers plug in the phrases of each task.
+        
+        :returns table without phrases
+        :rtype HTMLTable
+        '''
+        template = copy.copy(self)
+        template.store = PhraseStore(score_dtype=self.store.scores.dtype)
+        template._doc = None
+        template._tbl = None
+        template.render_cache = None
+        template.quantile_binner = None
+        template.exact_binner = None
+        template.score_index = None
+        template.raw_token_ids = {}
+        template.stats = {}
+        for method_name in self.INSTRUMENTED_METHODS:
+            template.__dict__.pop(method_name, None)
+        return template
+
+    #------------------------------------
+    # instrument
+    #-------------------
+    
+    @contextlib.contextmanager
+    def instrument(self, memory=False, profile_path=None, snapshot_path=None):
+        '''
+        Context manager that records wall time, number of
+        calls, and optionally allocated bytes of this table's
+        methods listed in INSTRUMENTED_METHODS, while the
+        context is active. Yields a stats dict:
+        
+            method name --> {'calls'   : <int>,
+                             'seconds' : <float>,
+                             'bytes'   : <int>}
+        
+            with tbl.instrument(memory=True) as stats:
+                tbl.add_rows(more_phrases)
+                tbl.write_to(fd)
+            
+        Times include nested calls: write_to() includes the
+        time of update_bins() if bins were stale. Styling the
+        words is timed in render_row_pair() for the STREAM
+        backend, and in phrase_styles() for DOMONIC documents
+        with inline styles; render_rows() adds creating the
+        domonic elements, and write_to() serializing them.
+        Bytes are the net growth of memory traced by
+        tracemalloc, counted only with memory=True. The stats
+        are also available in self.stats.
+        
+        While instrumenting, the methods are wrapped by 
+        instance attributes, which are removed on exit. 
+        Uninstrumented tables thus pay nothing.
+        
+        :param memory: whether to trace allocations
+        :type memory: bool
+        :param profile_path: file for a cProfile dump of 
+            the context, readable with pstats
+        :type profile_path: {None | str}
+        :param snapshot_path: file for a tracemalloc snapshot
+            taken at the end of the context; implies memory=True
+        :type snapshot_path: {None | str}
+        '''
+        if any(method_name in self.__dict__ for method_name in self.INSTRUMENTED_METHODS):
+            raise RuntimeError('Table is already being instrumented')
+        
+        import cProfile
+        
+        memory = memory or snapshot_path is not None
+        started_tracing = memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        self.stats = {}
+        for method_name in self.INSTRUMENTED_METHODS:
+            setattr(self, method_name, 
+                    self._instrumented(method_name, getattr(self, method_name), memory))
+        profiler = cProfile.Profile() if profile_path is not None else None
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield self.stats
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(profile_path)
+            for method_name in self.INSTRUMENTED_METHODS:
+                delattr(self, method_name)
+            if snapshot_path is not None:
+                tracemalloc.take_snapshot().dump(snapshot_path)
+            if started_tracing:
+                tracemalloc.stop()
+
+    #------------------------------------
+    # _instrumented
+    #-------------------
+    
+    def _instrumented(self, method_name, method, memory):
+        '''
+        Return a wrapper of the given bound method that
+        adds each call's time, and optionally net allocated
+        bytes to self.stats[method_name].
+        '''
+        entry = self.stats.setdefault(method_name, {'calls' : 0, 'seconds' : 0., 'bytes' : 0})
+        
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            if memory:
+                mem_before = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                entry['seconds'] += time.perf_counter() - start
+                entry['calls']   += 1
+                if memory:
+                    entry['bytes'] += tracemalloc.get_traced_memory()[0] - mem_before
+        return wrapper
+
+    #------------------------------------
+    # render_to_web
+    #-------------------
+    
+    def render_to_web(self, server=None, out_dir=None, timeout=30):
+        '''
+        Open the default browser, and display the table there.
+        
+        Without arguments the table is served from memory by
+        a TableServer of its own, which is shut down once the
+        browser has fetched the page, or after timeout seconds.
+        Returns the page's URL.
+        
+        To return right away, either pass a running TableServer,
+        which serves the table from memory; the table's URL is
+        returned, and server.wait_until_fetched(url) reports when
+        the browser has loaded the page. Or pass a directory in
+        out_dir, where the document is kept in a uniquely named 
+        file; the file's path is returned, and removing the file
+        is up to the caller. Use web_page() instead to have the
+        file removed when done.
+    
+        :param server: server from which to serve the table
+        :type server: {None | TableServer}
+        :param out_dir: directory in which to keep the HTML file
+        :type out_dir: {None | str}
+        :param timeout: seconds to wait for the browser to 
+            fetch the page, without server and out_dir
+        :type timeout: float
+        :return URL, or file path of the displayed document
+        :rtype str
+        '''
+        if server is not None:
+            url = server.publish(self)
+            webbrowser.open_new_tab(url)
+            return url
+        
+        if out_dir is not None:
+            path = self._write_web_page(out_dir)
+            webbrowser.open_new_tab(f"file://{path}")
+            return path
+        
+        with TableServer() as own_server:
+            url = own_server.publish(self, remove_after_fetch=True)
+            webbrowser.open_new_tab(url)
+            own_server.wait_until_fetched(url, timeout)
+        return url
+    
+    #------------------------------------
+    # web_page
+    #-------------------
+    
+    @contextlib.contextmanager
+    def web_page(self, out_dir=None, open_browser=True):
+        '''
+        Context manager that writes the document to a uniquely 
+        named file, by default opens the browser on it, and yields
+        the file's path. On exit the file is removed, and so is
+        the temporary directory created when out_dir is None.
+        Keep the block open until the browser has read the file.
+        
+        Usage:
+            with tbl.web_page() as path:
+                input('Press Enter when done viewing')
+        
+        :param out_dir: directory in which to write the file
+        :type out_dir: {None | str}
+        :param open_browser: whether to open the file in the
+            default browser
+        :type open_browser: bool
+        :return path of the HTML file
+        :rtype str
+        '''
+        with contextlib.ExitStack() as cleanup:
+            if out_dir is None:
+                out_dir = cleanup.enter_context(tempfile.TemporaryDirectory(prefix='attrs_'))
+            path = self._write_web_page(out_dir)
+            cleanup.callback(os.remove, path)
+            if open_browser:
+                webbrowser.open_new_tab(f"file://{path}")
+            yield path
+    
+    #------------------------------------
+    # _write_web_page
+    #-------------------
+    
+    def _write_web_page(self, out_dir):
+        '''
+        Write the document to a new, uniquely named
+        file in out_dir, and return the file's path.
+        '''
+        fd = tempfile.NamedTemporaryFile(prefix='attrs_', 
+                                         suffix='.html', 
+                                         dir=out_dir,
+                                         delete=False)
+        with fd:
+            self.write_to(fd)
+        return fd.name
+    
+    #------------------------------------
+    # canonicalize_word_attr
+    #-------------------
+    
+    def canonicalize_word_attr(self, word_attribution):
+        '''
+        Given one word/score pair, modify the word or
+        attribution score for use with HTML: the word's
+        &, <, >, and quote characters are escaped.
+        
+        :param word_attribution: word/attribution_score to clean
+        :type word_attribution: (str, {str | float | int})
+        :return an HTML-safe tuple
+        :rtype (str, float)
+        '''
+        word, score = word_attribution
+        return (html.escape(word), float(score))
+
+    #------------------------------------
+    # padded_phrase
+    #-------------------
+    
+    def padded_phrase(self, phrase_num):
+        '''
+        Return the words and scores of one phrase, padded
+        with PAD_WORD/PAD_SCORE to the table width.
+        
+        :param phrase_num: index of the phrase in self.store
+        :type phrase_num: int
+        :return the phrase's words and scores
+        :rtype ([str], [float])
+        '''
+        token_ids, scores = self.store.phrase(phrase_num)
+        num_pads = self.store.width - len(token_ids)
+        return (self.store.words(token_ids) + [self.PAD_WORD] * num_pads,
+                scores.tolist() + [self.PAD_SCORE] * num_pads)
+
+    #------------------------------------
+    # all_word_attributions
+    #-------------------
+    
+    @property
+    def all_word_attributions(self):
+        '''
+        The table's phrases as one array of shape
+        (num_phrases, table_width, 2), holding (word, score)
+        string pairs, with shorter phrases padded. Built from 
+        self.store on each access; for inspection only.
+        
+        :return all phrases as word/score string pairs
+        :rtype np.ndarray
+        '''
+        store = self.store
+        if store.num_phrases == 0:
+            return np.array([])
+        words  = np.full((store.num_phrases, store.width), self.PAD_WORD, dtype=object)
+        scores = np.full((store.num_phrases, store.width), self.PAD_SCORE)
+        # Row and column of each stored token in the padded table:
+        rows = np.repeat(np.arange(store.num_phrases), store.lengths)
+        cols = np.arange(store.num_tokens) - store.offsets[rows]
+        words[rows, cols]  = store.words(store.token_ids)
+        scores[rows, cols] = store.scores
+        return np.stack((words.astype(str), scores.astype(str)), axis=-1)
+
+    #------------------------------------
+    # adjust_table_width
+    #-------------------
+    
+    def adjust_table_width(self, new_phrase_data):
+        '''
+        Given a phrase as an array of shape (1, phrase_width, 2),
+        make the phrase and the table equally wide. Since phrases 
+        are padded only when rendered, widening the table just 
+        raises the width to which phrases will be padded. A 
+        phrase narrower than the table is returned padded.
+        
+        :param new_phrase_data: (word, score) pairs of one phrase
+        :type new_phrase_data: np.ndarray
+        :return phrase data, padded to the table width
+        :rtype np.ndarray
+        '''
+        
+        _num_phrases, phrase_width, _tuple_len = new_phrase_data.shape
+        
+        if self.store.width <= phrase_width:
+            # Widen the already existing table:
+            self.store.widen(phrase_width)
+            return new_phrase_data
+        
+        # Widen the new phrase:
+        num_pads = self.store.width - phrase_width
+        padding  = np.array([[(self.PAD_WORD, self.PAD_SCORE)] * num_pads])
+        return np.hstack((new_phrase_data, padding))
+        
+
+# ------------------- Multiprocess Rendering ------------
+
+# The table, without phrases, with whose settings a
+# worker process of HTMLTable.render() renders rows;
+# see HTMLTable.render_template():
+_render_tbl = None
+
+def _init_render_worker(tbl):
+    global _render_tbl
+    _render_tbl = tbl
+
+def _render_row_pairs(store):
+    '''
+    Return the HTML of the row-pair of each phrase
+    in store, whose bins are already computed.
+    '''
+    _render_tbl.store = store
+    _render_tbl.num_binned_rows = store.num_phrases
+    _render_tbl.binned_width    = store.width
+    return [_render_tbl.render_row_pair(row_num) for row_num in range(store.num_phrases)]
+
+# ------------------- Class PhraseStore ------------
+
+class PhraseStore:
+    '''
+    Columnar storage for the phrases of an HTMLTable.
+    Instead of one array of (word, score) string pairs
+    the store holds:
+    
+        o scores:    float array with the scores of all
+                     phrases' words, concatenated
+        o token_ids: int array parallel to scores with
+                     each word's index into vocab
+        o vocab:     list of distinct words
+        o bin_ids:   int array parallel to scores with
+                     each word's bin id, as assigned by the
+                     table's binning
+        o offsets:   CSR style phrase boundaries: phrase i
+                     occupies [offsets[i], offsets[i+1]) of
+                     scores, token_ids, and bin_ids
+    
+    and three arrays with one entry per phrase:
+    
+        o group_ids:   the group each phrase belongs to;
+                       index into groups
+        o pad_bin_ids: bin id of the cells that pad each
+                       phrase to the table width
+        o style_ids:   how each phrase's words are styled,
+                       such as a WordStyles value
+                     
+    The arrays grow by doubling their capacity, so appending 
+    phrases one at a time costs amortized O(phrase length).
+    '''
+    
+    # Initial number of tokens and phrases for
+    # which space is allocated:
+    INITIAL_CAPACITY = 256
+    
+    TOKEN_ID_DTYPE = np.int32
+    BIN_ID_DTYPE   = np.int16
+    OFFSET_DTYPE   = np.int64
+    STYLE_ID_DTYPE = np.int8
+
+    #------------------------------------
+    # Constructor
+    #-------------------
+
+    def __init__(self, score_dtype=np.float64):
+        
+        self.vocab = []
+        self.token_index = {}
+        # Distinct groups, and group --> group id:
+        self.groups = []
+        self.group_index = {}
+        
+        self.num_phrases = 0
+        self.num_tokens  = 0
+        # Number of words in the longest and shortest 
+        # phrase. Phrases are stored with their own lengths;
+        # width is the length to which they are padded 
+        # for display:
+        self.width       = 0
+        self.min_length  = 0
+        
+        self._scores    = np.empty(self.INITIAL_CAPACITY, dtype=score_dtype)
+        self._token_ids = np.empty(self.INITIAL_CAPACITY, dtype=self.TOKEN_ID_DTYPE)
+        self._bin_ids   = np.zeros(self.INITIAL_CAPACITY, dtype=self.BIN_ID_DTYPE)
+        self._offsets   = np.zeros(self.INITIAL_CAPACITY + 1, dtype=self.OFFSET_DTYPE)
+        self._group_ids   = np.zeros(self.INITIAL_CAPACITY, dtype=self.TOKEN_ID_DTYPE)
+        self._pad_bin_ids = np.zeros(self.INITIAL_CAPACITY, dtype=self.BIN_ID_DTYPE)
+        self._style_ids   = np.zeros(self.INITIAL_CAPACITY, dtype=self.STYLE_ID_DTYPE)
+
+    #------------------------------------
+    # scores, token_ids, bin_ids, group_ids, pad_bin_ids, style_ids, offsets, lengths
+    #-------------------
+
+    @property
+    def scores(self):
+        return self._scores[:self.num_tokens]
+
+    @property
+    def token_ids(self):
+        return self._token_ids[:self.num_tokens]
+
+    @property
+    def bin_ids(self):
+        return self._bin_ids[:self.num_tokens]
+
+    @property
+    def group_ids(self):
+        return self._group_ids[:self.num_phrases]
+
+    @property
+    def pad_bin_ids(self):
+        return self._pad_bin_ids[:self.num_phrases]
+
+    @property
+    def style_ids(self):
+        return self._style_ids[:self.num_phrases]
+
+    @property
+    def offsets(self):
+        return self._offsets[:self.num_phrases + 1]
+    
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    #------------------------------------
+    # append
+    #-------------------
+    
+    def append(self, words, scores, group_id=0, style_id=0):
+        '''
+        Add one phrase. The bin ids of its words and 
+        padding are 0 until set by the caller.
+        
+        :param words: the phrase's words
+        :type words: [str]
+        :param scores: the phrase's scores, one per word
+        :type scores: {[float] | np.ndarray}
+        :param group_id: group the phrase belongs to
+        :type group_id: int
+        :param style_id: how the phrase is styled
+        :type style_id: int
+        '''
+        num_words = len(words)
+        if len(scores) != num_words:
+            raise ValueError(f"Phrase has {num_words} words, but {len(scores)} scores")
+        scores = self.finite_scores(scores)
+
+        self._reserve(num_words, 1)
+        start = self.num_tokens
+        end   = start + num_words
+        self._token_ids[start:end] = self.intern(words)
+        self._scores[start:end]    = scores
+        self._bin_ids[start:end]   = 0
+        self._group_ids[self.num_phrases]   = group_id
+        self._pad_bin_ids[self.num_phrases] = 0
+        self._style_ids[self.num_phrases]   = style_id
+        self.num_tokens   = end
+        self.num_phrases += 1
+        self._offsets[self.num_phrases] = end
+        self.min_length = num_words if self.num_phrases == 1 else min(self.min_length, num_words)
+        self.width = max(self.width, num_words)
+
+    #------------------------------------
+    # finite_scores
+    #-------------------
+    
+    def finite_scores(self, scores):
+        '''
+        Return the given scores as an array of the store's
+        score type. NaN and infinite scores, also those that
+        overflow the score type, fit no bin, and raise a
+        ValueError.
+        
+        :param scores: scores to add
+        :type scores: {[float] | np.ndarray}
+        :return the scores as stored
+        :rtype np.ndarray
+        '''
+        with np.errstate(over='ignore'):
+            scores = np.asarray(scores, dtype=self._scores.dtype)
+        finite = np.isfinite(scores)
+        if not finite.all():
+            bad_pos = int(np.argmin(finite))
+            raise ValueError(f"Scores must be finite, but score {bad_pos} is {scores[bad_pos]}")
+        return scores
+
+    #------------------------------------
+    # extend
+    #-------------------
+    
+    def extend(self, token_ids, scores, lengths, group_id=0, style_id=0):
+        '''
+        Add many phrases at once, given as the concatenation
+        of their token ids and scores, and the length of each
+        phrase. Bin ids are 0 until set by the caller.
+        
+        :param token_ids: vocabulary ids of all phrases' tokens;
+            see intern()
+        :type token_ids: np.ndarray
+        :param scores: score of each token
+        :type scores: np.ndarray
+        :param lengths: number of tokens in each phrase
+        :type lengths: np.ndarray
+        :param group_id: group the phrases belong to
+        :type group_id: int
+        :param style_id: how the phrases are styled
+        :type style_id: int
+        '''
+        num_words   = len(token_ids)
+        num_phrases = len(lengths)
+        if len(scores) != num_words or np.sum(lengths) != num_words:
+            raise ValueError(f"Phrase lengths add up to {np.sum(lengths)}, but there are "
+                             f"{num_words} token ids, and {len(scores)} scores")
+        if num_phrases == 0:
+            return
+        scores = self.finite_scores(scores)
+
+        self._reserve(num_words, num_phrases)
+        start = self.num_tokens
+        end   = start + num_words
+        first = self.num_phrases
+        self._token_ids[start:end] = token_ids
+        self._scores[start:end]    = scores
+        self._bin_ids[start:end]   = 0
+        self._group_ids[first:first + num_phrases]   = group_id
+        self._pad_bin_ids[first:first + num_phrases] = 0
+        self._style_ids[first:first + num_phrases]   = style_id
+        self._offsets[first + 1:first + num_phrases + 1] = start + np.cumsum(lengths)
+        self.num_tokens   = end
+        self.num_phrases += num_phrases
+        min_length = int(np.min(lengths))
+        self.min_length = min_length if first == 0 else min(self.min_length, min_length)
+        self.width = max(self.width, int(np.max(lengths)))
+
+    #------------------------------------
+    # phrase
+    #-------------------
+    
+    def phrase(self, phrase_num):
+        '''
+        Return views of one phrase's token ids and scores.
+        
+        :param phrase_num: index of the phrase
+        :type phrase_num: int
+        :return token ids and scores of the phrase
+        :rtype (np.ndarray, np.ndarray)
+        '''
+        start, end = self._offsets[phrase_num], self._offsets[phrase_num + 1]
+        return self._token_ids[start:end], self._scores[start:end]
+
+    #------------------------------------
+    # phrase_bin_ids
+    #-------------------
+    
+    def phrase_bin_ids(self, phrase_num):
+        '''
+        Return a view of one phrase's bin ids.
+        
+        :param phrase_num: index of the phrase
+        :type phrase_num: int
+        :return bin ids of the phrase's words
+        :rtype np.ndarray
+        '''
+        return self._bin_ids[self._offsets[phrase_num]:self._offsets[phrase_num + 1]]
+
+    #------------------------------------
+    # intern
+    #-------------------
+    
+    def intern(self, words):
+        '''
+        Return the token ids of the given words, adding
+        words not yet seen to the vocabulary.
+        
+        :param words: words to look up
+        :type words: [str]
+        :return token id of each word
+        :rtype np.ndarray
+        '''
+        token_index = self.token_index
+        token_ids = np.empty(len(words), dtype=self.TOKEN_ID_DTYPE)
+        for i, word in enumerate(words):
+            token_id = token_index.get(word)
+            if token_id is None:
+                token_id = len(self.vocab)
+                token_index[word] = token_id
+                self.vocab.append(word)
+            token_ids[i] = token_id
+        return token_ids
+
+    #------------------------------------
+    # intern_group
+    #-------------------
+    
+    def intern_group(self, group):
+        '''
+        Return the group id of the given group, adding
+        the group if not yet seen.
+        
+        :param group: any hashable
+        :type group: Hashable
+        :return group id
+        :rtype int
+        '''
+        group_id = self.group_index.get(group)
+        if group_id is None:
+            group_id = len(self.groups)
+            self.group_index[group] = group_id
+            self.groups.append(group)
+        return group_id
+
+    #------------------------------------
+    # words
+    #-------------------
+    
+    def words(self, token_ids):
+        '''
+        Map token ids back to words.
+        
+        :param token_ids: ids to look up
+        :type token_ids: np.ndarray
+        :return the corresponding words
+        :rtype [str]
+        '''
+        vocab = self.vocab
+        return [vocab[token_id] for token_id in token_ids.tolist()]
+
+    #------------------------------------
+    # take
+    #-------------------
+    
+    def take(self, phrase_nums):
+        '''
+        Return an in-memory store with copies of the given
+        phrases, with their bin ids and stylings, and only
+        the part of the vocabulary they use. The copy keeps
+        this store's width, so that its phrases are padded
+        as they are here. Used to send rows to other 
+        processes without sending the whole store.
+        
+        :param phrase_nums: indexes of the phrases to copy
+        :type phrase_nums: {[int] | np.ndarray}
+        :return store with the phrases, in the given order
+        :rtype PhraseStore
+        '''
+        phrase_nums = np.asarray(phrase_nums, dtype=np.int64)
+        offsets = self.offsets
+        starts  = offsets[phrase_nums]
+        lengths = offsets[phrase_nums + 1] - starts
+        # Position in this store of each word to copy:
+        positions = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + \
+                    np.arange(int(lengths.sum()))
+        used_ids, token_ids = np.unique(self.token_ids[positions], return_inverse=True)
+        
+        taken = PhraseStore(score_dtype=self._scores.dtype)
+        taken.vocab = self.words(used_ids)
+        taken.token_index = {word : token_id for token_id, word in enumerate(taken.vocab)}
+        taken.groups = list(self.groups)
+        taken.group_index = dict(self.group_index)
+        taken.extend(token_ids, self.scores[positions], lengths)
+        taken.bin_ids[:] = self.bin_ids[positions]
+        taken.group_ids[:]   = self.group_ids[phrase_nums]
+        taken.pad_bin_ids[:] = self.pad_bin_ids[phrase_nums]
+        taken.style_ids[:]   = self.style_ids[phrase_nums]
+        taken.widen(self.width)
+        return taken
+
+    #------------------------------------
+    # widen
+    #-------------------
+    
+    def widen(self, width):
+        '''
+        Raise the width to which phrases are padded
+        for display. Nothing is copied.
+        
+        :param width: minimum table width
+        :type width: int
+        '''
+        self.width = max(self.width, width)
+
+    #------------------------------------
+    # _reserve
+    #-------------------
+    
+    def _reserve(self, num_tokens, num_phrases):
+        '''
+        Ensure there is room for num_tokens more tokens,
+        and num_phrases more phrases. Capacity at least
+        doubles when it needs to grow.
+        '''
+        needed = self.num_tokens + num_tokens
+        if needed > len(self._scores):
+            capacity = max(needed, 2 * len(self._scores))
+            self._scores    = self._grow(self._scores, capacity, self.num_tokens)
+            self._token_ids = self._grow(self._token_ids, capacity, self.num_tokens)
+            self._bin_ids   = self._grow(self._bin_ids, capacity, self.num_tokens)
+        needed = self.num_phrases + num_phrases + 1
+        if needed > len(self._offsets):
+            capacity = max(needed, 2 * len(self._offsets))
+            self._offsets = self._grow(self._offsets, capacity, self.num_phrases + 1)
+            self._group_ids   = self._grow(self._group_ids, capacity, self.num_phrases)
+            self._pad_bin_ids = self._grow(self._pad_bin_ids, capacity, self.num_phrases)
+            self._style_ids   = self._grow(self._style_ids, capacity, self.num_phrases)
+
+    #------------------------------------
+    # _grow
+    #-------------------
+    
+    def _grow(self, arr, capacity, num_used):
+        '''
+        Return a copy of arr with the given capacity, 
+        whose first num_used elements are those of arr.
+        '''
+        new_arr = np.empty(capacity, dtype=arr.dtype)
+        new_arr[:num_used] = arr[:num_used]
+        return new_arr
+
+    #------------------------------------
+    # flush
+    #-------------------
+    
+    def flush(self):
+        '''
+        Persist the store's content. Nothing to do for
+        stores in memory; see MmapPhraseStore.
+        '''
+        pass
+
+# ------------------- Class MmapPhraseStore ------------
+
+class MmapPhraseStore(PhraseStore):
+    '''
+    PhraseStore whose arrays live in memory-mapped .npy
+    files, so that corpus-scale tables occupy only the
+    pages of RAM in use. All files are in one directory:
+    
+        o <array>.npy:   one file per array, such as scores.npy
+        o vocab.jsonl:   one JSON encoded word per line
+        o groups.jsonl:  one JSON encoded group per line
+        o store.json:    numbers of phrases and tokens, and the 
+                         phrase lengths
+    
+    Creating a store on a directory that already holds one
+    reopens that store, with the score dtype it was created
+    with. Content is persisted by flush(). Groups must be
+    strings, numbers, None, or tuples of these, so that they
+    are the same after reopening; tuples are stored as JSON
+    lists, and read back as tuples.
+    
+    Growing an array copies its file into a new file of
+    twice the capacity.
+    '''
+    
+    ARRAY_NAMES = ('scores', 'token_ids', 'bin_ids', 'offsets', 
+                   'group_ids', 'pad_bin_ids', 'style_ids')
+    META_FILE   = 'store.json'
+    VOCAB_FILE  = 'vocab.jsonl'
+    GROUPS_FILE = 'groups.jsonl'
+    # Number of elements copied at a time when
+    # growing an array:
+    COPY_CHUNK  = 2**20
+
+    #------------------------------------
+    # Constructor
+    #-------------------
+
+    def __init__(self, store_dir, score_dtype=np.float64):
+        '''
+        Create a new store in store_dir, or reopen the
+        one that is there.
+        
+        :param store_dir: directory of the store's files
+        :type store_dir: str
+        :param score_dtype: float type of new stores' scores
+        :type score_dtype: np.dtype
+        '''
+        super().__init__(score_dtype=score_dtype)
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+        
+        if os.path.exists(self._path(self.META_FILE)):
+            self._load()
+            return
+        
+        # Move the freshly allocated arrays to files:
+        for name in self.ARRAY_NAMES:
+            arr = getattr(self, f'_{name}')
+            setattr(self, f'_{name}', self._copy_to_file(arr, len(arr), len(arr), self._path(f'{name}.npy')))
+        # Numbers of words and groups already in
+        # the vocab and groups files:
+        self.num_saved_words  = 0
+        self.num_saved_groups = 0
+        self.flush()
+
+    #------------------------------------
+    # flush
+    #-------------------
+    
+    def flush(self):
+        '''
+        Write changed pages of the arrays to their files, 
+        append new words and groups to their files, and 
+        then record the store's size. A store reopened after
+        a crash holds the content of the last flush().
+        '''
+        for name in self.ARRAY_NAMES:
+            getattr(self, f'_{name}').flush()
+        self.num_saved_words  = self._append_lines(self.VOCAB_FILE, self.vocab, self.num_saved_words)
+        self.num_saved_groups = self._append_lines(self.GROUPS_FILE, self.groups, self.num_saved_groups)
+        
+        meta = {'num_phrases' : self.num_phrases,
+                'num_tokens'  : self.num_tokens,
+                'width'       : self.width,
+                'min_length'  : self.min_length,
+                'num_words'   : self.num_saved_words,
+                'num_groups'  : self.num_saved_groups
+                }
+        tmp_path = self._path(f'{self.META_FILE}.tmp')
+        with open(tmp_path, 'w', encoding='utf8') as fd:
+            json.dump(meta, fd)
+        os.replace(tmp_path, self._path(self.META_FILE))
+
+    #------------------------------------
+    # _load
+    #-------------------
+    
+    def _load(self):
+        '''
+        Map the arrays of the store in self.store_dir, 
+        and read its vocabulary, groups, and size.
+        '''
+        with open(self._path(self.META_FILE), encoding='utf8') as fd:
+            meta = json.load(fd)
+        for name in self.ARRAY_NAMES:
+            setattr(self, f'_{name}', 
+                    np.lib.format.open_memmap(self._path(f'{name}.npy'), mode='r+'))
+        
+        self.vocab  = self._read_lines(self.VOCAB_FILE, meta['num_words'])
+        self.token_index = {word : token_id for token_id, word in enumerate(self.vocab)}
+        self.groups = [self._group_from_json(group) 
+                       for group in self._read_lines(self.GROUPS_FILE, meta['num_groups'])]
+        self.group_index = {group : group_id for group_id, group in enumerate(self.groups)}
+        self.num_saved_words  = len(self.vocab)
+        self.num_saved_groups = len(self.groups)
+        
+        self.num_phrases = meta['num_phrases']
+        self.num_tokens  = meta['num_tokens']
+        self.width       = meta['width']
+        self.min_length  = meta['min_length']
+
+    #------------------------------------
+    # intern_group
+    #-------------------
+    
+    def intern_group(self, group):
+        '''
+        Like PhraseStore.intern_group(), but rejects
+        groups that would differ after reopening the store.
+        '''
+        if group not in self.group_index:
+            try:
+                reloaded = self._group_from_json(json.loads(json.dumps(group)))
+            except TypeError:
+                reloaded = None
+            if reloaded != group or type(reloaded) != type(group):
+                raise ValueError(f"Group {group!r} cannot be stored; use strings, "
+                                 f"numbers, None, or tuples of these")
+        return super().intern_group(group)
+
+    #------------------------------------
+    # _group_from_json
+    #-------------------
+    
+    @classmethod
+    def _group_from_json(cls, value):
+        '''
+        Return a JSON decoded group with its lists,
+        which were tuples, turned back into tuples.
+        '''
+        if isinstance(value, list):
+            return tuple(cls._group_from_json(element) for element in value)
+        return value
+
+    #------------------------------------
+    # _grow
+    #-------------------
+    
+    def _grow(self, arr, capacity, num_used):
+        '''
+        Return a memory map of arr's file, grown to the
+        given capacity. The first num_used elements are
+        copied; the rest are 0.
+        '''
+        path = arr.filename
+        arr.flush()
+        self._copy_to_file(arr, capacity, num_used, f'{path}.tmp')
+        os.replace(f'{path}.tmp', path)
+        return np.lib.format.open_memmap(path, mode='r+')
+
+    #------------------------------------
+    # _copy_to_file
+    #-------------------
+    
+    def _copy_to_file(self, arr, capacity, num_used, path):
+        '''
+        Create a .npy file at path for capacity elements
+        of arr's dtype, copy the first num_used elements
+        of arr into it, chunk by chunk, and return the 
+        file's memory map.
+        '''
+        new_arr = np.lib.format.open_memmap(path, mode='w+', dtype=arr.dtype, shape=(capacity,))
+        for start in range(0, num_used, self.COPY_CHUNK):
+            end = min(start + self.COPY_CHUNK, num_used)
+            new_arr[start:end] = arr[start:end]
+        new_arr.flush()
+        return new_arr
+
+    #------------------------------------
+    # _append_lines
+    #-------------------
+    
+    def _append_lines(self, file_name, values, num_saved):
+        '''
+        Append values from index num_saved on to a JSON lines
+        file, and return the number of values in the file.
+        '''
+        if num_saved < len(values):
+            with open(self._path(file_name), 'a', encoding='utf8') as fd:
+                fd.writelines(f'{json.dumps(value)}\n' for value in values[num_saved:])
+        return len(values)
+
+    #------------------------------------
+    # _read_lines
+    #-------------------
+    
+    def _read_lines(self, file_name, num_values):
+        '''
+        Return the first num_values values of a JSON lines
+        file. Lines beyond were written by a flush() that
+        did not complete; they are cut off.
+        '''
+        path = self._path(file_name)
+        if not os.path.exists(path):
+            return []
+        with open(path, 'r+b') as fd:
+            values = [json.loads(fd.readline()) for _ in range(num_values)]
+            fd.truncate(fd.tell())
+        return values
+
+    def _path(self, file_name):
+        return os.path.join(self.store_dir, file_name)
+
+# ------------------- Class Binner ------------   
+
+class Binner:
+
+    #------------------------------------
+    # Constructor
+    #-------------------
+
+    def __init__(self, in_range, out_range, num_bins):
+        
+        self.in_min, self.in_max   = in_range
+        self.out_min, self.out_max = out_range
+        self.create_bins(num_bins)
+
+    #------------------------------------
+    # select_bin
+    #-------------------
+
+    def select_bin(self, in_value):
+        
+        val = self.map_range(in_value)
+        for bin_id, _bin in enumerate(self.bins):
+            bin_low, bin_high = _bin
+            if val >= bin_low and val < bin_high:
+                return bin_id
+        return -1
+
+    #------------------------------------
+    # map_range
+    #-------------------
+     
+    def map_range(self, value):
+        if value >= self.out_min and value < self.out_max:
+            return value
+        if value < self.in_min or value > self.in_max:
+            raise IndexError(f"Value {value} not in [{self.bins[0][0]}, {self.bins[-1][1]})")
+        return self.out_min + (((value - self.in_min) / (self.in_max - self.in_min)) * (self.out_max - self.out_min))
+
+    #------------------------------------
+    # select_bins
+    #-------------------
+
+    def select_bins(self, in_values, out_of_range=OutOfRange.MINUS_ONE):
+        '''
+        Array version of select_bin(): map all values
+        with one affine transform, and find their bins with
+        one searchsorted over the bins' lower bounds. Values
+        outside the input range are treated as the out_of_range
+        policy prescribes, rather than raising IndexError.
+        
+        :param in_values: values to assign to bins
+        :type in_values: {np.ndarray | [float]}
+        :param out_of_range: what to do with out-of-range values
+        :type out_of_range: OutOfRange
+        :return bin id of each value
+        :rtype {np.ndarray | np.ma.MaskedArray}
+        '''
+        vals, outside = self._map_ranges(in_values, out_of_range)
+        lows  = np.array([bin_low for bin_low, _bin_high in self.bins])
+        highs = np.array([bin_high for _bin_low, bin_high in self.bins])
+        
+        bin_ids = np.searchsorted(lows, vals, side='right') - 1
+        # Values below the first, or beyond the last bin,
+        # belong to no bin:
+        no_bin = (bin_ids < 0) | ~(vals < highs[np.maximum(bin_ids, 0)])
+        bin_ids[no_bin] = -1
+        
+        if out_of_range == OutOfRange.MASK:
+            return np.ma.masked_array(bin_ids, mask=outside | no_bin)
+        return bin_ids
+
+    #------------------------------------
+    # map_ranges
+    #-------------------
+
+    def map_ranges(self, values, out_of_range=OutOfRange.MINUS_ONE):
+        '''
+        Array version of map_range(). Values outside the 
+        input range are clipped, masked, or mapped to NaN,
+        depending on the out_of_range policy.
+        
+        :param values: values to map
+        :type values: {np.ndarray | [float]}
+        :param out_of_range: what to do with out-of-range values
+        :type out_of_range: OutOfRange
+        :return mapped values
+        :rtype {np.ndarray | np.ma.MaskedArray}
+        '''
+        mapped, outside = self._map_ranges(values, out_of_range)
+        if out_of_range == OutOfRange.MASK:
+            return np.ma.masked_array(mapped, mask=outside)
+        return mapped
+
+    #------------------------------------
+    # _map_ranges
+    #-------------------
+
+    def _map_ranges(self, values, out_of_range):
+        '''
+        Map values as map_range() does, and return
+        the mapped values, plus a boolean array that 
+        is True where a value is out of range. Out-of-range 
+        values are clipped under the CLIP policy, and 
+        NaN otherwise.
+        '''
+        if type(out_of_range) != OutOfRange:
+            raise ValueError(f'Bad out-of-range policy: {out_of_range}')
+        
+        values = np.asarray(values, dtype=float)
+        # Like map_range(), leave values alone that
+        # already lie in the output range:
+        in_out_range = (values >= self.out_min) & (values < self.out_max)
+        outside = ~in_out_range & ((values < self.in_min) | (values > self.in_max))
+        if out_of_range == OutOfRange.CLIP:
+            values = np.where(outside, np.clip(values, self.in_min, self.in_max), values)
+            
+        # Same operation order as map_range(), so both
+        # round identically:
+        mapped = np.where(in_out_range, 
+                          values, 
+                          self.out_min + (((values - self.in_min) / (self.in_max - self.in_min)) 
+                                          * (self.out_max - self.out_min)))
+        if out_of_range != OutOfRange.CLIP:
+            mapped[outside] = np.nan
+            return mapped, outside
+        return mapped, np.zeros(mapped.shape, dtype=bool)
+
+    #------------------------------------
+    # create_bins
+    #-------------------
+    
+    def create_bins(self, num_bins):
+
+        bins = []
+        width = (self.out_max - self.out_min) / num_bins 
+        
+        low = self.out_min
+        while low < self.out_max:
+            bins.append((low, low+width))
+            low += width
+        # Make the last bin inclusive of the max 
+        # val of out-range. I.e. make the max out 
+        # range value satisfy "< last_box_high":
+        bins[-1] = (bins[-1][0], bins[-1][1] + 0.0001)
+        self.bins = bins
+
+# ------------------- Class QuantileBinner ----------
+
+class QuantileBinner:
+    
+    @staticmethod
+    def qcut(x, bin_info):
+        """
+        Quantile-based discretization function.
+        Discretize variable into equal-sized buckets based on sample quantiles. 
+        For example 1000 values for 10 quantiles would
+        produce a Categorical object indicating quantile membership for each data point.
+        
+        Returns
+        -------
+        out : Categorical or Series or array of integers if labels is False
+            The return type (Categorical or Series) depends on the input: a Series
+            of type category if input is a Series else Categorical. Bins are
+            represented as categories when categorical data is returned.
+        bins : ndarray of floats
+            Returned only if `retbins` is True.
+        Notes
+        -----
+        Out of bounds values will be NA in the resulting Categorical object
+        Examples
+        --------
+        >>> pd.qcut(range(5), 4)
+        ... # doctest: +ELLIPSIS
+        [(-0.001, 1.0], (-0.001, 1.0], (1.0, 2.0], (2.0, 3.0], (3.0, 4.0]]
+        Categories (4, interval[float64, right]): [(-0.001, 1.0] < (1.0, 2.0] ...
+        >>> pd.qcut(range(5), 3, labels=["good", "medium", "bad"])
+        ... # doctest: +SKIP
+        [good, good, medium, bad, bad]
+        Categories (3, object): [good < medium < bad]
+        >>> pd.qcut(range(5), 4, labels=False)
+        array([0, 0, 1, 2, 3])
+        """
+        bins = QuantileBinner.edges(x, bin_info)
+    
+        ids = QuantileBinner._bins_to_cuts(x, bins)
+    
+        return ids
+
+    @staticmethod
+    def edges(x, bin_info):
+        '''
+        Return the upper edges of the quantile bins that
+        qcut() would use for x. Callers that hold on
+        to the edges can assign further values to bins
+        via _bins_to_cuts() without re-sorting x.
+        
+        :param x: numbers from which to compute quantiles
+        :type x: {np.array | [float]}
+        :param bin_info: either a single int number of bins,
+            or a list of quantiles
+        :type bin_info: {int | [float]}
+        :return upper edge of each bin
+        :rtype np.array
+        '''
+        # np.unique returns a sorted copy; x
+        # itself must stay untouched, since callers
+        # bin its values in their original order:
+        x_np = np.unique(np.asarray(x, dtype=float))
+        x_np = x_np[~np.isnan(x_np)]
+        
+        bins = np.quantile(x_np, QuantileBinner.quantile_levels(bin_info))
+        return bins
+    
+    @staticmethod
+    def quantile_levels(bin_info):
+        '''
+        Return the quantiles at which the upper bin edges
+        lie: for a number of bins, the evenly spaced 
+        quantiles above 0, ending with 1.
+        
+        :param bin_info: either a single int number of bins,
+            or a list of quantiles
+        :type bin_info: {int | [float]}
+        :return quantile of each bin's upper edge
+        :rtype np.array
+        '''
+        if type(bin_info) == int:
+            # the +1 replaces the zeroeth percentile, which is
+            # removed by the [1:]:
+            return np.linspace(0, 1, bin_info + 1)[1:]
+        return np.asarray(bin_info, dtype=float)
+    
+    @staticmethod
+    def grouped_qcut(x, groups, bin_info, num_groups=None):
+        '''
+        Like qcut(), but with separate quantile bins for each
+        group of values. Equivalent to calling qcut() on the
+        values of each group, but the edges of all groups are 
+        computed in one vectorized pass: values are sorted once 
+        by (group, value), and the quantiles of every group are 
+        interpolated from that order at once, the same way 
+        np.quantile interpolates them.
+        
+        NaN values, and groups without values get NaN edges;
+        NaN values are assigned bin id len(quantiles), as 
+        searchsorted would assign them.
+        
+        :param x: numbers to assign to bins
+        :type x: {np.array | [float]}
+        :param groups: group id of each number in x, 0 <= id < num_groups
+        :type groups: {np.array | [int]}
+        :param bin_info: either a single int number of bins,
+            or a list of quantiles
+        :type bin_info: {int | [float]}
+        :param num_groups: number of groups; default: max(groups)+1
+        :type num_groups: {None | int}
+        :return bin id of each value, and an array of shape
+            (num_groups, num_bins) with each group's upper bin edges
+        :rtype (np.array, np.array)
+        '''
+        x      = np.asarray(x, dtype=float)
+        groups = np.asarray(groups, dtype=np.int64)
+        quantiles = QuantileBinner.quantile_levels(bin_info)
+        if num_groups is None:
+            num_groups = groups.max() + 1 if len(groups) > 0 else 0
+        num_bins = len(quantiles)
+
+        ids = np.full(len(x), num_bins, dtype=np.int64)
+        
+        # Sort by group, then value, leaving out NaNs:
+        valid = np.flatnonzero(~np.isnan(x))
+        order = valid[np.lexsort((x[valid], groups[valid]))]
+        xs, gs = x[order], groups[order]
+        num_sorted = len(xs)
+        if num_sorted == 0:
+            return ids, np.full((num_groups, num_bins), np.nan)
+        
+        group_size  = np.bincount(gs, minlength=num_groups)
+        group_start = np.cumsum(group_size) - group_size
+        
+        # Unique values within each group: the first
+        # position of each run of equal (group, value):
+        run_starts = np.ones(num_sorted, dtype=bool)
+        run_starts[1:] = (gs[1:] != gs[:-1]) | (xs[1:] != xs[:-1])
+        first = np.flatnonzero(run_starts)
+        uniq_x, uniq_g = xs[first], gs[first]
+        num_uniq   = np.bincount(uniq_g, minlength=num_groups)
+        uniq_start = np.cumsum(num_uniq) - num_uniq
+        # Number of the group's values less than, and 
+        # less than or equal to each unique value:
+        num_lt = first - group_start[uniq_g]
+        num_le = np.append(first[1:], num_sorted) - group_start[uniq_g]
+        
+        # Interpolate between neighboring unique values 
+        # for every group and quantile at once:
+        edges, lo, hi = QuantileBinner._interpolate(uniq_x, 
+                                                    quantiles[None, :],
+                                                    uniq_start[:, None],
+                                                    np.maximum(num_uniq - 1, 0)[:, None])
+        edges[num_uniq == 0] = np.nan
+        a, b = uniq_x[lo], uniq_x[hi]
+        
+        # A value is above an edge if its rank within its group 
+        # is at least the number of group values <= the edge:
+        num_le_edge = np.where(edges >= b, num_le[hi], 
+                               np.where(edges >= a, num_le[lo], num_lt[lo]))
+        rank = np.arange(num_sorted) - group_start[gs]
+        sorted_ids = np.zeros(num_sorted, dtype=np.int64)
+        for bin_num in range(num_bins):
+            sorted_ids += rank >= num_le_edge[gs, bin_num]
+        ids[order] = sorted_ids
+        
+        return ids, edges
+    
+    @staticmethod
+    def sorted_quantiles(sorted_x, quantiles):
+        '''
+        Return np.quantile(sorted_x, quantiles) for an array,
+        or SortedBlocks, that is already in ascending order, 
+        without NaNs, using np.quantile's linear interpolation,
+        without partitioning the array. The result is identical 
+        to np.quantile's. An empty array yields NaN quantiles.
+        
+        :param sorted_x: numbers in ascending order
+        :type sorted_x: {np.array | SortedBlocks}
+        :param quantiles: quantiles between 0 and 1
+        :type quantiles: np.array
+        :return value at each quantile
+        :rtype np.array
+        '''
+        quantiles = np.asarray(quantiles, dtype=float)
+        if len(sorted_x) == 0:
+            return np.full(len(quantiles), np.nan)
+        edges, _lo, _hi = QuantileBinner._interpolate(sorted_x, quantiles, 0, len(sorted_x) - 1)
+        return edges
+
+    @staticmethod
+    def _interpolate(sorted_x, quantiles, start, last):
+        '''
+        Interpolate quantiles of ascending runs of values in
+        sorted_x the way np.quantile does by default. A run 
+        holds the values from position start to start + last.
+        Passing columns of starts and lasts yields one row of
+        quantiles per run; runs with last 0 that would start
+        past the end of sorted_x are clamped to its end.
+        
+        :param sorted_x: non-empty runs of numbers in ascending order
+        :type sorted_x: np.array
+        :param quantiles: quantiles between 0 and 1
+        :type quantiles: np.array
+        :param start: position of each run's first value
+        :type start: {int | np.array}
+        :param last: position of each run's last value within the run
+        :type last: {int | np.array}
+        :return value at each quantile, and the positions in 
+            sorted_x of the two values it is interpolated between
+        :rtype (np.array, np.array, np.array)
+        '''
+        virtual_idx = last * quantiles
+        prev_idx = np.floor(virtual_idx)
+        gamma    = virtual_idx - prev_idx
+        prev_idx = np.clip(prev_idx.astype(np.int64), 0, last)
+        next_idx = np.minimum(prev_idx + 1, last)
+        lo = np.minimum(start + prev_idx, len(sorted_x) - 1)
+        hi = np.minimum(start + next_idx, len(sorted_x) - 1)
+        a, b = sorted_x[lo], sorted_x[hi]
+        diff   = b - a
+        values = a + diff * gamma
+        np.subtract(b, diff * (1 - gamma), out=values, where=gamma >= 0.5)
+        return values, lo, hi
+
+    @staticmethod
+    def _bins_to_cuts(x, unique_bins):
+        '''
+        
+        :param x: sorted array of numbers that are to be assigned
+            into bins
+        :type x: np.array
+        :param unique_bins: either a single int generate quantiles,
+            or a list of quantiles
+        :type unique_bins: {int | [float]}
+        :return
+        :rtype
+        '''
+    
+        ids = unique_bins.searchsorted(x)
+        return ids
+
+# ------------------- Class SortedBlocks ----------
+
+class SortedBlocks:
+    '''
+    Numbers kept in ascending order in a list of sorted 
+    blocks of at most 2 * BLOCK_SIZE numbers. Inserting 
+    b numbers sorts them, and copies only the blocks they 
+    fall into, rather than all n numbers: O(b log b + b log n)
+    comparisons, plus one copy of each block touched, plus 
+    O(n / BLOCK_SIZE) to update the blocks' first numbers 
+    and ranks. Numbers at given ranks are found by binary
+    search.
+    
+    Holds the sorted distinct scores of an 
+    IncrementalQuantileBinner.
+    
+    Usage:
+        numbers = SortedBlocks()
+        numbers.insert([3., 1., 2.])
+        numbers[[0, 2]]          # array([1., 3.])
+        numbers.contains([2., 4.]) # array([ True, False])
+    '''
+    
+    BLOCK_SIZE = 2**16
+
+    #------------------------------------
+    # Constructor
+    #-------------------
+
+    def __init__(self):
+        
+        # Sorted blocks of numbers:
+        self.blocks = []
+        # First number of each block, and rank of each 
+        # block's first number; the last rank is the 
+        # total number of numbers:
+        self.firsts = np.empty(0)
+        self.starts = np.zeros(1, dtype=np.int64)
+
+    #------------------------------------
+    # __len__
+    #-------------------
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    #------------------------------------
+    # __getitem__
+    #-------------------
+
+    def __getitem__(self, ranks):
+        '''
+        Return the numbers at the given ranks, i.e. the
+        positions they would have in one sorted array.
+        Meant for few ranks, such as those of quantiles.
+        
+        :param ranks: ranks between 0 and len(self) - 1
+        :type ranks: {int | np.array}
+        :return number at each rank
+        :rtype {float | np.array}
+        '''
+        ranks = np.asarray(ranks, dtype=np.int64)
+        flat_ranks = ranks.ravel()
+        block_nums = self.starts.searchsorted(flat_ranks, side='right') - 1
+        numbers = np.empty(len(flat_ranks))
+        for block_num in np.unique(block_nums).tolist():
+            in_block = block_nums == block_num
+            numbers[in_block] = self.blocks[block_num][flat_ranks[in_block] - self.starts[block_num]]
+        return numbers.reshape(ranks.shape) if ranks.ndim > 0 else numbers[0]
+
+    #------------------------------------
+    # insert
+    #-------------------
+
+    def insert(self, numbers):
+        '''
+        Add numbers.
+        
+        :param numbers: numbers to add; no NaNs
+        :type numbers: {np.array | [float]}
+        '''
+        numbers = np.sort(np.asarray(numbers, dtype=float).ravel())
+        if len(numbers) == 0:
+            return
+        if not self.blocks:
+            self.blocks = [np.empty(0)]
+            block_nums = np.zeros(len(numbers), dtype=np.int64)
+        else:
+            block_nums = self._block_nums(numbers)
+        
+        # Merge each run of numbers into its block, from
+        # the last block on, so that splitting a block does
+        # not shift the blocks still to be merged into:
+        run_starts, run_ends = self._runs(block_nums)
+        for run_start, run_end in zip(run_starts[::-1].tolist(), run_ends[::-1].tolist()):
+            block_num = int(block_nums[run_start])
+            block = self.blocks[block_num]
+            run   = numbers[run_start:run_end]
+            run_positions = block.searchsorted(run, side='right') + np.arange(len(run))
+            self.blocks[block_num:block_num + 1] = self._split(self._merge(block, run, run_positions))
+        self.firsts = np.fromiter((block[0] for block in self.blocks), dtype=float, count=len(self.blocks))
+        self.starts = np.append(0, np.cumsum([len(block) for block in self.blocks]))
+
+    #------------------------------------
+    # contains
+    #-------------------
+
+    def contains(self, numbers):
+        '''
+        Return whether each of the numbers was inserted.
+        
+        :param numbers: numbers to look up, in ascending order
+        :type numbers: {np.array | [float]}
+        :return one bool per number
+        :rtype np.array
+        '''
+        numbers = np.asarray(numbers, dtype=float).ravel()
+        found = np.zeros(len(numbers), dtype=bool)
+        if not self.blocks or len(numbers) == 0:
+            return found
+        block_nums = self._block_nums(numbers)
+        run_starts, run_ends = self._runs(block_nums)
+        for run_start, run_end in zip(run_starts.tolist(), run_ends.tolist()):
+            block     = self.blocks[int(block_nums[run_start])]
+            run       = numbers[run_start:run_end]
+            positions = np.minimum(block.searchsorted(run), len(block) - 1)
+            found[run_start:run_end] = block[positions] == run
+        return found
+
+    #------------------------------------
+    # to_array
+    #-------------------
+
+    def to_array(self):
+        '''
+        Return all numbers as one sorted array.
+        '''
+        return np.concatenate(self.blocks) if self.blocks else np.empty(0)
+
+    #------------------------------------
+    # _merge
+    #-------------------
+
+    def _merge(self, block, run, run_positions):
+        '''
+        Return a new array with the numbers of run at
+        run_positions, and those of block, in order, at
+        the other positions: the two merged in linear time.
+        '''
+        merged = np.empty(len(block) + len(run))
+        from_block = np.ones(len(merged), dtype=bool)
+        from_block[run_positions] = False
+        merged[run_positions] = run
+        merged[from_block] = block
+        return merged
+
+    #------------------------------------
+    # _block_nums
+    #-------------------
+
+    def _block_nums(self, numbers):
+        '''
+        Return the number of the block into which 
+        each number falls.
+        '''
+        return np.maximum(self.firsts.searchsorted(numbers, side='right') - 1, 0)
+
+    #------------------------------------
+    # _runs
+    #-------------------
+
+    def _runs(self, block_nums):
+        '''
+        Return the start and end index of each run of 
+        equal block numbers in ascending block_nums.
+        '''
+        run_starts = np.append(0, np.flatnonzero(np.diff(block_nums)) + 1)
+        run_ends   = np.append(run_starts[1:], len(block_nums))
+        return run_starts, run_ends
+
+    #------------------------------------
+    # _split
+    #-------------------
+
+    def _split(self, block):
+        '''
+        Return a merged block as a list of blocks
+        of at most 2 * BLOCK_SIZE numbers.
+        '''
+        if len(block) <= 2 * self.BLOCK_SIZE:
+            return [block]
+        return [block[start:start + self.BLOCK_SIZE] 
+                for start in range(0, len(block), self.BLOCK_SIZE)]
+
+# ------------------- Class ScoreIndex ----------
+
+class ScoreIndex:
+    '''
+    Positions of words, indexed by their scores, for
+    finding the words whose scores lie in a range without
+    scanning all scores. Scores and positions are kept in
+    sorted runs, longest first, each less than half as long
+    as the one before it (a log-structured merge): each 
+    batch of b scores is sorted into a new run, which is 
+    merged into the run before it while that run is at 
+    most twice as long. Over all inserts, each score is 
+    thus copied O(log n) times, rather than once per 
+    insert. A range query binary searches each of the 
+    O(log n) runs, and copies only the scores found.
+    
+    Usage:
+        index = ScoreIndex()
+        index.insert(np.array([3., 1., 2.]), np.array([10, 11, 12]))
+        index.between(1., 3.)   # (array([2., 3.]), array([12, 10]))
+    '''
+
+    #------------------------------------
+    # Constructor
+    #-------------------
+
+    def __init__(self):
+        
+        # (scores, positions) of each run, scores
+        # ascending, longest run first:
+        self.runs = []
+
+    #------------------------------------
+    # __len__
+    #-------------------
+
+    def __len__(self):
+        return sum(len(scores) for scores, _positions in self.runs)
+
+    #------------------------------------
+    # insert
+    #-------------------
+
+    def insert(self, scores, positions):
+        '''
+        Add scores, and the positions of their words.
+        
+        :param scores: scores to add; no NaNs
+        :type scores: np.array
+        :param positions: position of each score's word
+        :type positions: np.array
+        '''
+        scores = np.asarray(scores, dtype=float).ravel()
+        if len(scores) == 0:
+            return
+        order = scores.argsort()
+        run = (scores[order], np.asarray(positions, dtype=np.int64).ravel()[order])
+        while self.runs and len(self.runs[-1][0]) <= 2 * len(run[0]):
+            # NumPy's stable sort merges the two ascending
+            # runs of the concatenation in linear time:
+            prior_scores, prior_positions = self.runs.pop()
+            merged_scores = np.concatenate((prior_scores, run[0]))
+            order = merged_scores.argsort(kind='stable')
+            run = (merged_scores[order], np.concatenate((prior_positions, run[1]))[order])
+        self.runs.append(run)
+
+    #------------------------------------
+    # between
+    #-------------------
+
+    def between(self, low, high):
+        '''
+        Return the scores x with low < x <= high, and
+        the positions of their words.
+        
+        :param low: exclusive lower bound
+        :type low: float
+        :param high: inclusive upper bound
+        :type high: float
+        :return scores in the range, and their positions
+        :rtype (np.array, np.array)
+        '''
+        slices = [slice(scores.searchsorted(low, side='right'), scores.searchsorted(high, side='right'))
+                  for scores, _positions in self.runs]
+        found_scores = [scores[run_slice] for (scores, _positions), run_slice in zip(self.runs, slices)]
+        positions    = [positions[run_slice] for (_scores, positions), run_slice in zip(self.runs, slices)]
+        return (np.concatenate(found_scores + [np.empty(0)]), 
+                np.concatenate(positions + [np.empty(0, dtype=np.int64)]))
+
+# ------------------- Class IncrementalQuantileBinner ----------
+
+class IncrementalQuantileBinner:
+    '''
+    Exact quantile bins over scores that arrive in batches.
+    The edges are those QuantileBinner.edges() computes over
+    all scores seen, but the scores are not re-sorted for
+    each batch: the distinct scores are kept sorted in
+    SortedBlocks, into which each batch's new distinct 
+    scores are inserted. Edges are interpolated from the 
+    sorted scores directly, and cached until the next batch
+    adds a score not seen before.
+    
+    A batch costs O(b log b + b log n) comparisons for b
+    scores in the batch, and n distinct scores so far, plus
+    copying the blocks of SortedBlocks.BLOCK_SIZE scores that
+    new scores fall into, rather than all n scores. Memory is
+    n floats; where that is too much, use the 
+    StreamingQuantileBinner.
+    
+    Usage:
+        binner = IncrementalQuantileBinner()
+        for batch in score_batches:
+            binner.update(batch)
+            edges = binner.edges(5)
+    '''
+
+    #------------------------------------
+    # Constructor
+    #-------------------
+
+    def __init__(self):
+        
+        # Distinct scores seen, in ascending order:
+        self.values = SortedBlocks()
+        self.num_scores = 0
+        # bin_info --> edges, for the current values:
+        self.edges_cache = {}
+
+    #------------------------------------
+    # update
+    #-------------------
+
+    def update(self, scores):
+        '''
+        Add a batch of scores. NaNs are ignored.
+        
+        :param scores: scores to add
+        :type scores: {np.array | [float]}
+        '''
+        scores = np.asarray(scores, dtype=float).ravel()
+        batch_values = np.unique(scores[~np.isnan(scores)])
+        self.num_scores += len(scores) - np.isnan(scores).sum()
+        if len(batch_values) == 0:
+            return
+        
+        known = self.values.contains(batch_values)
+        if known.all():
+            return
+        self.values.insert(batch_values[~known])
+        self.edges_cache.clear()
+
+    #------------------------------------
+    # edges
+    #-------------------
+
+    def edges(self, bin_info):
+        '''
+        Return the upper edges of the quantile bins over
+        all scores seen, equal to those QuantileBinner.edges()
+        would return.
+        
+        :param bin_info: either a single int number of bins,
+            or a list of quantiles
+        :type bin_info: {int | [float]}
+        :return upper edge of each bin
+        :rtype np.array
+        '''
+        key = bin_info if type(bin_info) == int else tuple(bin_info)
+        try:
+            return self.edges_cache[key].copy()
+        except KeyError:
+            pass
+        quantiles = QuantileBinner.quantile_levels(bin_info)
+        edges = QuantileBinner.sorted_quantiles(self.values, quantiles)
+        self.edges_cache[key] = edges
+        return edges.copy()
+
+    #------------------------------------
+    # bin_ids
+    #-------------------
+
+    def bin_ids(self, scores, bin_info):
+        '''
+        Assign scores to the current quantile bins, the
+        way QuantileBinner.qcut() does.
+        
+        :param scores: scores to assign to bins
+        :type scores: {np.array | [float]}
+        :param bin_info: either a single int number of bins,
+            or a list of quantiles
+        :type bin_info: {int | [float]}
+        :return bin id of each score
+        :rtype np.array
+        '''
+        return QuantileBinner._bins_to_cuts(np.asarray(scores, dtype=float), self.edges(bin_info))
+
+# ------------------- Class StreamingQuantileBinner ----------
+
+class StreamingQuantileBinner:
+    '''
+    Approximate quantile bins over an unbounded stream
+    of scores, using a KLL sketch (Karnin, Lang, Liberty:
+    "Optimal Quantile Approximation in Streams", 2016).
+    
+    Scores are fed in batches via update(). The sketch
+    keeps a hierarchy of compactors: level h holds items 
+    that each stand for 2**h of the scores seen. When a 
+    level overflows, it is sorted, and every other item, 
+    starting at a random offset, is promoted to the next 
+    level. Memory grows only with the log of the number
+    of scores, and sketches built in different processes
+    can be combined with merge().
+    
+    Estimated ranks are within epsilon * num_scores of the
+    true ranks with high probability. Unlike qcut(), which
+    quantiles the distinct values, the sketch quantiles all
+    values with their multiplicity. For continuous scores
+    the two agree.
+    
+    Usage:
+        binner = StreamingQuantileBinner(epsilon=0.01)
+        for batch in score_batches:
+            binner.update(batch)
+        edges   = binner.edges(5)
+        bin_ids = binner.bin_ids(some_scores, 5)
+    '''
+    
+    # Size of the topmost compactor is K_FACTOR / epsilon:
+    K_FACTOR = 3.
+    # Each level below the top is this fraction of the
+    # size of the level above:
+    CAPACITY_DECAY = 2. / 3.
+    # Smallest number of items a level may hold:
+    MIN_CAPACITY   = 2
+
+    #------------------------------------
+    # Constructor
+    #-------------------
+
+    def __init__(self, epsilon=0.01, seed=None):
+        '''
+        :param epsilon: rank error bound as a fraction of
+            the number of scores seen
+        :type epsilon: float
+        :param seed: seed for the compaction offsets
+        :type seed: {None | int}
+        '''
+        if not 0 < epsilon < 1:
+            raise ValueError(f"Epsilon must be in (0, 1), not {epsilon}")
+        self.epsilon = epsilon
+        self.k = int(np.ceil(self.K_FACTOR / epsilon))
+        self.rng = np.random.default_rng(seed)
+        
+        self.levels = [np.empty(0)]
+        self.num_scores = 0
+        self.min_score  = np.inf
+        self.max_score  = -np.inf
+
+    #------------------------------------
+    # update
+    #-------------------
+
+    def update(self, scores):
+        '''
+        Add a batch of scores to the sketch. NaNs
+        are ignored.
+        
+        :param scores: scores to add
+        :type scores: {np.array | [float]}
+        '''
+        scores = np.asarray(scores, dtype=float).ravel()
+        scores = scores[~np.isnan(scores)]
+        if len(scores) == 0:
+            return
+        self.num_scores += len(scores)
+        self.min_score = min(self.min_score, scores.min())
+        self.max_score = max(self.max_score, scores.max())
+        self.levels[0] = np.concatenate((self.levels[0], scores))
+        self._compress()
+
+    #------------------------------------
+    # merge
+    #-------------------
+
+    def merge(self, other):
+        '''
+        Fold the scores summarized by another sketch
+        into this one. The sketches must have been 
+        created with the same epsilon.
+        
+        :param other: sketch to merge into this one
+        :type other: StreamingQuantileBinner
+        :return this sketch
+        :rtype StreamingQuantileBinner
+        '''
+        if other.k != self.k:
+            raise ValueError(f"Cannot merge sketches of epsilon {self.epsilon} and {other.epsilon}")
+        for level, items in enumerate(other.levels):
+            if level < len(self.levels):
+                self.levels[level] = np.concatenate((self.levels[level], items))
+            else:
+                self.levels.append(items.copy())
+        self.num_scores += other.num_scores
+        self.min_score = min(self.min_score, other.min_score)
+        self.max_score = max(self.max_score, other.max_score)
+        self._compress()
+        return self
+
+    #------------------------------------
+    # edges
+    #-------------------
+
+    def edges(self, bin_info):
+        '''
+        Return the estimated upper edges of the quantile 
+        bins, in the same form as QuantileBinner.edges().
+        The last edge of num_bins bins is the exact 
+        maximum of the scores.
+        
+        :param bin_info: either a single int number of bins,
+            or a list of quantiles
+        :type bin_info: {int | [float]}
+        :return upper edge of each bin
+        :rtype np.array
+        '''
+        quantiles = QuantileBinner.quantile_levels(bin_info)
+        if self.num_scores == 0:
+            return np.full(len(quantiles), np.nan)
+        
+        items, weights = self._weighted_items()
+        # Estimated number of scores <= each item:
+        ranks = np.cumsum(weights)
+        # Smallest item whose rank covers the quantile:
+        positions = np.searchsorted(ranks, quantiles * ranks[-1], side='left')
+        edges = items[np.minimum(positions, len(items) - 1)]
+        edges[quantiles <= 0] = self.min_score
+        edges[quantiles >= 1] = self.max_score
+        return edges
+
+    #------------------------------------
+    # bin_ids
+    #-------------------
+
+    def bin_ids(self, x, bin_info):
+        '''
+        Assign values to the sketch's quantile bins.
+        
+        :param x: values to assign
+        :type x: {np.array | [float]}
+        :param bin_info: either a single int number of bins,
+            or a list of quantiles
+        :type bin_info: {int | [float]}
+        :return bin id of each value
+        :rtype np.array
+        '''
+        return QuantileBinner._bins_to_cuts(x, self.edges(bin_info))
+
+    #------------------------------------
+    # rank
+    #-------------------
+
+    def rank(self, value):
+        '''
+        Estimated number of scores <= value.
+        
+        :param value: value whose rank to estimate
+        :type value: float
+        :return estimated rank
+        :rtype int
+        '''
+        items, weights = self._weighted_items()
+        return int(weights[:np.searchsorted(items, value, side='right')].sum())
+
+    #------------------------------------
+    # num_items
+    #-------------------
+
+    @property
+    def num_items(self):
+        '''
+        Number of items held by the sketch.
+        '''
+        return sum(len(items) for items in self.levels)
+
+    #------------------------------------
+    # _weighted_items
+    #-------------------
+
+    def _weighted_items(self):
+        '''
+        Return all items in the sketch, sorted, and the
+        number of scores each stands for.
+        '''
+        items   = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level_items), 2 ** level, dtype=np.int64)
+                                  for level, level_items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        return items[order], weights[order]
+
+    #------------------------------------
+    # _capacity
+    #-------------------
+
+    def _capacity(self, level):
+        '''
+        Number of items the given level may hold: the 
+        top level holds k items, lower levels geometrically
+        fewer.
+        '''
+        depth = len(self.levels) - 1 - level
+        return max(self.MIN_CAPACITY, int(np.ceil(self.k * self.CAPACITY_DECAY ** depth)))
+
+    #------------------------------------
+    # _compress
+    #-------------------
+
+    def _compress(self):
+        '''
+        Compact overflowing levels, lowest first, until
+        every level is within its capacity.
+        '''
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays behind:
+                if len(items) % 2 == 1:
+                    keep, items = items[:1], items[1:]
+                else:
+                    keep = items[:0]
+                promoted = items[self.rng.integers(2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate((self.levels[level + 1], promoted))
+                # Adding a level lowered the capacities of
+                # the levels below; start over:
+                level = 0
+                continue
+            level += 1
+
+# ------------------- Class TableServer ----------
+
+class TableServer:
+    '''
+    Local HTTP server that serves HTMLTable documents
+    from memory, in a background thread. Any number of
+    tables may be published; each gets its own URL, and
+    an event that is set once a browser has fetched the
+    page. Nothing is written to disk, and nobody needs 
+    to sleep while the browser catches up.
+    
+    Usage:
+        with TableServer() as server:
+            url = tbl.render_to_web(server=server)
+            server.wait_until_fetched(url, timeout=30)
+            
+    A page holds the table as it was when published. With
+    remove_after_fetch=True the page is dropped from memory
+    as soon as it has been served once.
+    '''
+
+    #------------------------------------
+    # Constructor
+    #-------------------
+
+    def __init__(self, host='127.0.0.1', port=0):
+        '''
+        Start serving. Port 0 picks a free port; the
+        address actually used is in self.base_url.
+        
+        :param host: interface to listen on
+        :type host: str
+        :param port: port to listen on
+        :type port: int
+        '''
+        import http.server
+        
+        # URL path --> (html_bytes, remove_after_fetch):
+        self.pages = {}
+        # URL path --> event set once the page was served;
+        # outlives pages removed upon their first fetch:
+        self.fetched_events = {}
+        self.num_published = 0
+        self.lock = threading.Lock()
+
+        server = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                server._serve(self)
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        host, port = self.httpd.server_address[:2]
+        self.base_url = f"http://{host}:{port}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    #------------------------------------
+    # publish
+    #-------------------
+
+    def publish(self, tbl, remove_after_fetch=False):
+        '''
+        Make the given table available, and return its URL.
+        
+        :param tbl: table to serve
+        :type tbl: HTMLTable
+        :param remove_after_fetch: whether to drop the page
+            after it was served once
+        :type remove_after_fetch: bool
+        :return URL of the table
+        :rtype str
+        '''
+        html_bytes = tbl.to_html().encode('utf8')
+        with self.lock:
+            self.num_published += 1
+            path = f"/table{self.num_published}.html"
+            self.pages[path] = (html_bytes, remove_after_fetch)
+            self.fetched_events[path] = threading.Event()
+        return self.base_url + path
+
+    #------------------------------------
+    # wait_until_fetched
+    #-------------------
+
+    def wait_until_fetched(self, url, timeout=None):
+        '''
+        Block until the page at url has been served, or
+        until timeout seconds have passed. Returns True if
+        the page was served.
+        
+        :param url: URL returned by publish()
+        :type url: str
+        :param timeout: seconds to wait; None waits forever
+        :type timeout: {None | float}
+        :return whether the page was fetched
+        :rtype bool
+        '''
+        return self._fetched_event(url).wait(timeout)
+
+    #------------------------------------
+    # was_fetched
+    #-------------------
+
+    def was_fetched(self, url):
+        '''
+        Return whether the page at url has been served.
+        '''
+        return self._fetched_event(url).is_set()
+
+    #------------------------------------
+    # remove
+    #-------------------
+
+    def remove(self, url):
+        '''
+        Stop serving the page at url, and release its HTML.
+        Unknown URLs are ignored.
+        '''
+        with self.lock:
+            self.pages.pop(self._path(url), None)
+            self.fetched_events.pop(self._path(url), None)
+
+    #------------------------------------
+    # shutdown
+    #-------------------
+
+    def shutdown(self):
+        '''
+        Stop the server, and release all pages.
+        '''
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
+        with self.lock:
+            self.pages.clear()
+            self.fetched_events.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    #------------------------------------
+    # _serve
+    #-------------------
+
+    def _serve(self, request):
+        '''
+        Answer one GET request; runs in a server thread.
+        '''
+        with self.lock:
+            page = self.pages.get(request.path)
+            if page is None:
+                request.send_error(404)
+                return
+            html_bytes, remove_after_fetch = page
+            if remove_after_fetch:
+                del self.pages[request.path]
+            fetched = self.fetched_events[request.path]
+        request.send_response(200)
+        request.send_header('Content-Type', 'text/html; charset=utf-8')
+        request.send_header('Content-Length', str(len(html_bytes)))
+        request.end_headers()
+        request.wfile.write(html_bytes)
+        fetched.set()
+
+    #------------------------------------
+    # _fetched_event
+    #-------------------
+
+    def _fetched_event(self, url):
+        '''
+        Return the fetch event of a published url, even 
+        after the page was removed upon its first fetch.
+        '''
+        event = self.fetched_events.get(self._path(url))
+        if event is None:
+            raise KeyError(f"No table published at {url}")
+        return event
+
+    def _path(self, url):
+        return url[len(self.base_url):] if url.startswith(self.base_url) else url
+
+# ------------------- Class RenderCache ----------
+
+class RenderCache:
+    '''
+    Least-recently-used cache of rendered row-pair HTML,
+    keyed by a hash of everything that determines a row-pair's
+    HTML; see HTMLTable.row_pair_key(). The same phrases,
+    binned the same way, are thus rendered once, across
+    HTMLTable instances. Fragments are kept in memory, in
+    a directory, or both; the directory is shared by all
+    processes that use it.
+    
+    Usage:
+        cache = RenderCache(cache_dir='/tmp/nlpviz_cache')
+        html  = HTMLTable(phrases, render_cache=cache).to_html()
+        print(cache.hits, cache.misses)
+        
+    Each tier is bounded by a total number of bytes of 
+    fragments (characters, for the memory tier). The least
+    recently used fragments are evicted first; on disk,
+    recency is the files' modification time, which hits
+    refresh. Copies of a cache sent to worker processes
+    start out with an empty memory tier.
+    '''
+    
+    #------------------------------------
+    # Constructor
+    #-------------------
+
+    def __init__(self, max_memory_bytes=2**28, cache_dir=None, max_disk_bytes=2**30):
+        '''
+        :param max_memory_bytes: bound on the fragments held in
+            memory; 0 for no memory tier
+        :type max_memory_bytes: int
+        :param cache_dir: directory for fragment files, created
+            if needed; None for no disk tier
+        :type cache_dir: {None | str}
+        :param max_disk_bytes: bound on the size of the fragment
+            files in cache_dir
+        :type max_disk_bytes: int
+        '''
+        self.max_memory_bytes = max_memory_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        # Key --> fragment, least recently used first:
+        self.memory = collections.OrderedDict()
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.disk_bytes = sum(entry.stat().st_size for entry in self._disk_entries())
+        self.reset_counts()
+
+    #------------------------------------
+    # reset_counts
+    #-------------------
+
+    def reset_counts(self):
+        '''
+        Zero the hit and miss counters. Hits from
+        either tier are counted in hits; those served 
+        from disk also in disk_hits.
+        '''
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    #------------------------------------
+    # get
+    #-------------------
+
+    def get(self, key):
+        '''
+        Return the fragment cached under key, or None.
+        
+        :param key: hex digest of the fragment's inputs
+        :type key: str
+        :return cached HTML
+        :rtype {None | str}
+        '''
+        fragment = self.memory.get(key)
+        if fragment is not None:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return fragment
+        if self.cache_dir is not None:
+            path = self._path(key)
+            try:
+                with open(path, encoding='utf8') as fd:
+                    fragment = fd.read()
+                os.utime(path)
+            except FileNotFoundError:
+                # Never written, or evicted by another process:
+                pass
+            else:
+                self.hits += 1
+                self.disk_hits += 1
+                self._remember(key, fragment)
+                return fragment
+        self.misses += 1
+        return None
+
+    #------------------------------------
+    # put
+    #-------------------
+
+    def put(self, key, fragment):
+        '''
+        Cache a fragment under key in each tier, evicting
+        least recently used fragments as needed.
+        
+        :param key: hex digest of the fragment's inputs
+        :type key: str
+        :param fragment: HTML to cache
+        :type fragment: str
+        '''
+        self._remember(key, fragment)
+        if self.cache_dir is None:
+            return
+        data = fragment.encode('utf8')
+        if len(data) > self.max_disk_bytes:
+            return
+        # Write, then rename, so that readers in other
+        # processes never see partial files:
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, self._path(key))
+        self.disk_bytes += len(data)
+        if self.disk_bytes > self.max_disk_bytes:
+            self._evict_disk()
+
+    #------------------------------------
+    # clear
+    #-------------------
+
+    def clear(self):
+        '''
+        Remove all fragments from both tiers.
+        '''
+        self.memory.clear()
+        self.memory_bytes = 0
+        if self.cache_dir is not None:
+            for entry in self._disk_entries():
+                self._remove(entry.path)
+        self.disk_bytes = 0
+
+    #------------------------------------
+    # _remember
+    #-------------------
+
+    def _remember(self, key, fragment):
+        '''
+        Add a fragment to the memory tier, evicting the
+        least recently used fragments beyond max_memory_bytes.
+        '''
+        if len(fragment) > self.max_memory_bytes:
+            return
+        prior = self.memory.pop(key, None)
+        if prior is not None:
+            self.memory_bytes -= len(prior)
+        self.memory[key] = fragment
+        self.memory_bytes += len(fragment)
+        while self.memory_bytes > self.max_memory_bytes:
+            _key, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+
+    #------------------------------------
+    # _evict_disk
+    #-------------------
+
+    def _evict_disk(self):
+        '''
+        Delete the least recently used fragment files until
+        they total at most 90% of max_disk_bytes, so that 
+        eviction is not needed on every put(). Sizes are 
+        re-read, since other processes share the directory.
+        '''
+        entries = []
+        for entry in self._disk_entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        self.disk_bytes = sum(size for _mtime, size, _path in entries)
+        target = 0.9 * self.max_disk_bytes
+        for _mtime, size, path in entries:
+            if self.disk_bytes <= target:
+                break
+            self._remove(path)
+            self.disk_bytes -= size
+
+    def _disk_entries(self):
+        return [entry for entry in os.scandir(self.cache_dir) 
+                if entry.name.endswith('.html')]
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.html')
+
+    #------------------------------------
+    # __getstate__
+    #-------------------
+
+    def __getstate__(self):
+        # Worker processes share the disk tier,
+        # but need not receive the memory tier:
+        state = self.__dict__.copy()
+        state['memory'] = collections.OrderedDict()
+        state['memory_bytes'] = 0
+        return state
+
+# ------------------- Class SubwordMerger ----------
+
+class SubwordMerger:
+    '''
+    Merges the pieces into which subword tokenizers split
+    words back into words, combining the pieces' scores.
+    Works on the concatenated tokens and scores of many
+    phrases at once, with one ufunc.reduceat() per array.
+    
+    Usage:
+        merger = SubwordMerger(SubwordSchemes.WORDPIECE, SubwordReductions.MEAN)
+        words, scores, lengths = merger.merge(['un', '##like', '##ly', 'event'], 
+                                              [1., 2., 3., 4.], 
+                                              [4])
+        # ['unlikely', 'event'], [2., 4.], [2]
+        
+    Or have a table merge all phrases it is given:
+        tbl = HTMLTable(word_attrs, subword_merger=merger)
+    
+    A scheme is one of SubwordSchemes, or, for other
+    tokenizer conventions, a function that takes a list 
+    of tokens, and returns whether each token continues 
+    the word of the token before it, and each token with 
+    its markers removed. The first token of a phrase always
+    starts a word. Tokens stay Python strings throughout,
+    rather than a fixed-width numpy array as wide as the
+    longest token.
+    '''
+    
+    #------------------------------------
+    # Constructor
+    #-------------------
+
+    def __init__(self, scheme=SubwordSchemes.WORDPIECE, reduction=SubwordReductions.SUM):
+        '''
+        :param scheme: how the tokenizer marks pieces
+        :type scheme: {SubwordSchemes | callable}
+        :param reduction: how pieces' scores combine into
+            the score of their word
+        :type reduction: SubwordReductions
+        '''
+        if type(reduction) != SubwordReductions:
+            raise ValueError(f'Bad subword reduction: {reduction}')
+        if type(scheme) == SubwordSchemes:
+            scheme = {SubwordSchemes.WORDPIECE     : self.wordpiece_rule,
+                      SubwordSchemes.BPE           : functools.partial(self.word_start_rule, 
+                                                                       marker='Ġ'),
+                      SubwordSchemes.SENTENCEPIECE : functools.partial(self.word_start_rule, 
+                                                                       marker='▁')
+                      }[scheme]
+        elif not callable(scheme):
+            raise ValueError(f'Bad subword scheme: {scheme}')
+        self.rule = scheme
+        self.reduction = reduction
+
+    #------------------------------------
+    # merge
+    #-------------------
+
+    def merge(self, tokens, scores, lengths):
+        '''
+        Merge the pieces of the given phrases into words.
+        
+        :param tokens: pieces of all phrases, concatenated
+        :type tokens: {[str] | np.ndarray}
+        :param scores: score of each piece
+        :type scores: {[float] | np.ndarray}
+        :param lengths: number of pieces in each phrase
+        :type lengths: {[int] | np.ndarray}
+        :return the words of all phrases, the score of each 
+            word, and the number of words in each phrase
+        :rtype ([str], np.ndarray, np.ndarray)
+        '''
+        if isinstance(tokens, np.ndarray):
+            tokens = tokens.tolist()
+        scores  = np.asarray(scores, dtype=np.float64)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        if len(tokens) == 0:
+            return [], scores, lengths
+        
+        continues, pieces = self.rule(tokens)
+        starts_word = ~np.asarray(continues, dtype=bool)
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        starts_word[offsets[:-1][lengths > 0]] = True
+        
+        word_starts = np.flatnonzero(starts_word)
+        # Adding strings concatenates them:
+        words = np.add.reduceat(np.asarray(pieces, dtype=object), word_starts).tolist()
+        if self.reduction == SubwordReductions.MAX:
+            word_scores = np.maximum.reduceat(scores, word_starts)
+        else:
+            word_scores = np.add.reduceat(scores, word_starts)
+            if self.reduction == SubwordReductions.MEAN:
+                word_scores /= np.diff(word_starts, append=len(tokens))
+        # Words per phrase: word starts before each
+        # phrase's end, minus those before its start:
+        num_starts = np.concatenate(([0], np.cumsum(starts_word)))
+        return words, word_scores, np.diff(num_starts[offsets])
+
+    #------------------------------------
+    # wordpiece_rule
+    #-------------------
+
+    @staticmethod
+    def wordpiece_rule(tokens):
+        '''
+        Merge rule for tokenizers that mark pieces which
+        continue a word with '##', such as BERT's.
+        
+        :param tokens: pieces
+        :type tokens: [str]
+        :return whether each piece continues a word, and
+            the pieces without their markers
+        :rtype (np.ndarray, [str])
+        '''
+        continues = [token.startswith('##') for token in tokens]
+        pieces = [token[2:] if continued else token 
+                  for token, continued in zip(tokens, continues)]
+        return np.array(continues, dtype=bool), pieces
+
+    #------------------------------------
+    # word_start_rule
+    #-------------------
+
+    @staticmethod
+    def word_start_rule(tokens, marker):
+        '''
+        Merge rule for tokenizers that mark the pieces that
+        start a word, such as GPT-2's BPE with 'Ġ', or 
+        SentencePiece with '▁'.
+        
+        :param tokens: pieces
+        :type tokens: [str]
+        :param marker: prefix of word-initial pieces
+        :type marker: str
+        :return whether each piece continues a word, and
+            the pieces without their markers
+        :rtype (np.ndarray, [str])
+        '''
+        starts_word = [token.startswith(marker) for token in tokens]
+        pieces = [token[len(marker):] if started else token 
+                  for token, started in zip(tokens, starts_word)]
+        return ~np.array(starts_word, dtype=bool), pieces